@@ -4,8 +4,10 @@ from fastapi import APIRouter, Depends
 from .manage import router as manage_router
 from .search import router as search_router
 from .like import router as like_router
+from .stats import router as stats_router
 
 router = APIRouter()
 router.include_router(search_router, prefix="")
 router.include_router(manage_router, prefix="")
 router.include_router(like_router, prefix="")
+router.include_router(stats_router, prefix="")
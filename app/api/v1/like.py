@@ -1,44 +1,76 @@
+import asyncio
+import base64
 import hashlib
 import json
-from typing import Any, Dict, List
+import os
+from typing import Any, Dict, List, Optional, Set
 
 from cachetools import TTLCache
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 
 from dependencies import User, get_current_user
 from services.product_search import vectorSearch
-from services.cloud import supabase
-from currency_converter import CurrencyConverter
+from services.cloud import (
+    postgrest_count,
+    postgrest_delete,
+    postgrest_insert,
+    postgrest_select,
+)
+from services.product_hydration import hydrate_products
 import logging
 
 logger = logging.getLogger(__name__)
-convertCurrency = CurrencyConverter().convert
 
 router = APIRouter()
 
 
-def mark_liked_products(products: List[Dict], user_id: str) -> List[Dict]:
-    if not products or not user_id:
-        return products
+# user id -> set of liked product ids. Kept in sync by /like-product and
+# /unlike-product; the TTL bounds staleness from likes made via other workers.
+_liked_cache = TTLCache(
+    maxsize=int(os.getenv("LIKED_CACHE_SIZE", "10000")),
+    ttl=int(os.getenv("LIKED_CACHE_TTL", "300")),
+)
+
+LIKED_PAGE_SIZE = 1000  # PostgREST max rows per response
+
+
+async def liked_product_ids(user_id: str) -> Set[str]:
+    """All product ids the user has liked, loaded once and then cached."""
+    liked = _liked_cache.get(user_id)
+    if liked is not None:
+        return liked
+
+    liked = set()
+    offset = 0
+    while True:
+        rows = await postgrest_select(
+            "liked_products",
+            {
+                "select": "product",
+                "user": f"eq.{user_id}",
+                "order": "product",
+                "limit": LIKED_PAGE_SIZE,
+                "offset": offset,
+            },
+        )
+        liked.update(row["product"] for row in rows)
+        if len(rows) < LIKED_PAGE_SIZE:
+            break
+        offset += LIKED_PAGE_SIZE
 
-    product_ids = [p["id"] for p in products]
+    _liked_cache[user_id] = liked
+    return liked
 
-    liked_result = (
-        supabase.table("liked_products")
-        .select("product")
-        .eq("user", user_id)
-        .in_("product", product_ids)
-        .execute()
-    )
 
-    liked_ids = {entry["product"] for entry in (liked_result.data or [])}
-    print(liked_result)
-    print(liked_ids)
+async def mark_liked_products(products: List[Dict], user_id: str) -> List[Dict]:
+    if not products or not user_id:
+        return products
+
+    liked_ids = await liked_product_ids(user_id)
 
     for product in products:
         product["liked"] = product["id"] in liked_ids
-        if product["liked"]:
-            print(product)
 
     return products
 
@@ -56,13 +88,14 @@ async def like_product(
             raise HTTPException(status_code=400, detail="Product ID is required")
 
         # Insert record if not already liked
-        result = (
-            supabase.table("liked_products")
-            .insert({"user": current_user.id, "product": product_id})
-            .execute()
+        inserted = await postgrest_insert(
+            "liked_products", {"user": current_user.id, "product": product_id}
         )
 
-        if result.data:
+        if inserted:
+            liked = _liked_cache.get(current_user.id)
+            if liked is not None:
+                liked.add(product_id)
             return {"success": True, "message": "Product liked successfully"}
 
     except Exception as e:
@@ -82,14 +115,15 @@ async def unlike_product(
         if not product_id:
             raise HTTPException(status_code=400, detail="Product ID is required")
 
-        result = (
-            supabase.table("liked_products")
-            .delete()
-            .eq("user", current_user.id)
-            .eq("product", product_id)
-            .execute()
+        await postgrest_delete(
+            "liked_products",
+            {"user": f"eq.{current_user.id}", "product": f"eq.{product_id}"},
         )
 
+        liked = _liked_cache.get(current_user.id)
+        if liked is not None:
+            liked.discard(product_id)
+
         return {"success": True, "message": "Product unliked successfully"}
 
     except Exception as e:
@@ -99,155 +133,112 @@ async def unlike_product(
         )
 
 
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["created_at"], row["product"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> List[str]:
+    try:
+        created_at, product = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return [created_at, product]
+
+
+async def liked_products_count(user_id: str) -> int:
+    """From the liked-set cache when loaded, else a HEAD count."""
+    liked = _liked_cache.get(user_id)
+    if liked is not None:
+        return len(liked)
+    return await postgrest_count("liked_products", {"user": f"eq.{user_id}"})
+
+
 @router.get("/get-liked-products")
 async def get_liked_products(
     page: int = 1,
     limit: int = 10,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
 ) -> Dict[str, Any]:
     """
-    Get the current user's liked products with pagination support.
+    Get the current user's liked products, newest first, with pagination.
     Returns products in the same format as the search API.
 
     Args:
-        page: Page number (starts at 1)
+        page: Page number (starts at 1), for clients without cursors
         limit: Number of items per page
-        currency: Currency to convert prices to (default: DKK)
+        cursor: `next_cursor` of the previous page; every page costs the
+            same as the first (keyset on created_at, product)
         current_user: Current authenticated user
 
     Returns:
-        Dictionary containing paginated liked products and pagination metadata
+        Dictionary containing paginated liked products and pagination metadata:
+        total, limit and next_cursor, plus page and total_pages when paging
+        by page number (they don't apply to cursor paging)
     """
+    if page < 1:
+        page = 1
+    if limit < 1:
+        limit = 10
+
+    params = {
+        "select": "product,created_at",
+        "user": f"eq.{current_user.id}",
+        "order": "created_at.desc,product.desc",
+        "limit": limit + 1,  # one extra row tells whether there's a next page
+    }
+    if cursor:
+        created_at, product = _decode_cursor(cursor)
+        params["or"] = (
+            f'(created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",product.lt."{product}"))'
+        )
+    else:
+        params["offset"] = (page - 1) * limit
+
     try:
-        # Calculate pagination values
-        if page < 1:
-            page = 1
-        if limit < 1:
-            limit = 10
-
-        offset = (page - 1) * limit
-
-        # Get total count of user's liked products
-        count_result = (
-            supabase.table("liked_products")
-            .select("*", count="exact")
-            .eq("user", current_user.id)
-            .execute()
+        rows, total_count = await asyncio.gather(
+            postgrest_select("liked_products", params),
+            liked_products_count(current_user.id),
         )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
-        total_count = count_result.count or 0
-
-        # Get paginated liked products with full product data including images and listings
-        join_query = (
-            supabase.table("liked_products")
-            .select(
-                """
-                product,
-                products!inner(
-                    id, brand,
-                    product_images(url, s3_key, sort),
-                    v_product_listings:shop_listings!inner(*, variant(size), feeds(name, domain, bf_logo))
-                )
-                """
-            )
-            .eq("user", current_user.id)
-            .order("created_at", desc=True)
-            .range(offset, offset + limit - 1)
-            .execute()
+        # Product data from the shared hydration path (and its cache)
+        grouped = await hydrate_products(
+            [row["product"] for row in rows], current_user.currency or "DKK"
         )
 
         # Format products in the same way as search API
         liked_products = []
-        if join_query.data:
-            for idx, item in enumerate(join_query.data):
-                if item.get("products"):
-                    p = item["products"]
-
-                    # Process images
-                    imgs = sorted(
-                        p.get("product_images") or [], key=lambda i: i.get("sort", 0)
-                    )
-                    img_urls = [
-                        f"https://trendbook.s3.eu-west-1.amazonaws.com/{img['s3_key']}"
-                        for img in imgs
-                        if img.get("s3_key")
-                    ]
-
-                    # Process listings
-                    listings = p.get("v_product_listings", [])
-                    feed_listings = {}
-                    cheapest_price = None
-
-                    for lst in listings:
-                        if not lst.get("in_stock") or lst.get("price") is None:
-                            continue
-
-                        feed_name = lst["feeds"]["name"]
-
-                        converted_price = round(
-                            convertCurrency(
-                                lst["price"], lst["currency"], current_user.currency
-                            ),
-                            2,
-                        )
-
-                        if cheapest_price is None or converted_price < cheapest_price:
-                            cheapest_price = converted_price
-
-                        if feed_name not in feed_listings:
-                            feed_listings[feed_name] = {
-                                **lst["feeds"],
-                                "price_original": converted_price,
-                                "price": converted_price,
-                                "compare_price": (
-                                    round(
-                                        convertCurrency(
-                                            lst["compare_price"],
-                                            lst["currency"],
-                                            current_user.currency,
-                                        ),
-                                        2,
-                                    )
-                                    if lst["compare_price"] is not None
-                                    else None
-                                ),
-                                "original_currency": lst["currency"],
-                                "currency": current_user.currency,
-                                "link": lst["affiliate_url"],
-                                "sizes": [],
-                            }
-
-                        # Add the size if available
-                        size = lst.get("variant", {}).get("size")
-                        if size:
-                            feed_listings[feed_name]["sizes"].append(size)
-
-                    liked_products.append(
-                        {
-                            "id": p["id"],
-                            "brand": p["brand"],
-                            "from_price": cheapest_price,
-                            "currency": current_user.currency,
-                            "listings": list(feed_listings.values()),
-                            "images": img_urls,
-                            "liked": True,
-                            "index": idx,
-                        }
-                    )
-
-        # Calculate total pages
-        total_pages = (total_count + limit - 1) // limit if total_count > 0 else 0
-
-        return {
-            "success": True,
-            "products": liked_products,
-            "pagination": {
-                "total": total_count,
-                "page": page,
-                "limit": limit,
-                "total_pages": total_pages,
-            },
+        for row in rows:
+            if row["product"] in grouped:
+                liked_products.append(
+                    {
+                        **grouped[row["product"]],
+                        "liked": True,
+                        "index": len(liked_products),
+                    }
+                )
+
+        pagination = {
+            "total": total_count,
+            "limit": limit,
+            "next_cursor": _encode_cursor(rows[-1]) if has_more else None,
         }
+        if not cursor:
+            pagination["page"] = page
+            pagination["total_pages"] = (total_count + limit - 1) // limit
+
+        # Serialize straight to bytes (skips jsonable_encoder)
+        return ORJSONResponse(
+            {
+                "success": True,
+                "products": liked_products,
+                "pagination": pagination,
+            }
+        )
 
     except Exception as e:
         logger.error(f"Error retrieving liked products: {str(e)}")
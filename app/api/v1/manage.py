@@ -1,28 +1,31 @@
-import json
+import logging
 import time
-from fastapi import APIRouter, Depends
+from functools import lru_cache
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
 from typing import Dict, Any, List, Optional
 
-from fastapi.responses import JSONResponse
+import orjson
 import pycountry
-from dependencies import User, get_current_user
-from services.cloud import supabase, postgresql
+from cachetools import TTLCache
+from dependencies import User, get_current_user, invalidate_user, require_service_key
+from models.requests import ProductsUpdated, ProfileUpdate
+from services.cloud import supabase
+from services.currency import currency_rates
+from services.etags import etag_response, make_etag
+from services.facet_catalogue import FacetCatalogue, facet_catalogue
+from services.product_hydration import clear_product_cache, invalidate_products
+from services.product_search import qdrant
+from services.search_payload import enrich_payload
 from babel.numbers import get_currency_symbol
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+COUNTRY_CODES = frozenset(country.alpha_2 for country in pycountry.countries)
 
-def get_listers_filters(country) -> List[Dict[str, Any]]:
-    listers = postgresql.direct_query(
-        "SELECT id, name, bf_logo FROM tb2.feeds WHERE markets @> %s::jsonb AND status = 'ACTIVE';",
-        params=(json.dumps([country]),),
-    )
-    lister_list = [
-        {"id": row["id"], "name": row["name"], "icon": row["bf_logo"]}
-        for row in listers
-        if row["name"]
-    ]
 
+def get_listers_filters(lister_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return [
         {
             "key": "lister",
@@ -40,10 +43,7 @@ def get_listers_filters(country) -> List[Dict[str, Any]]:
     ]
 
 
-def get_brand_filters() -> List[Dict[str, Any]]:
-    brands = postgresql.direct_query("SELECT DISTINCT(brand) FROM tb2.products;")
-    brand_list = [row["brand"] for row in brands if row["brand"]]
-
+def get_brand_filters(brand_list: List[str]) -> List[Dict[str, Any]]:
     return [
         {
             "key": "brand",
@@ -85,19 +85,104 @@ def get_price_filter(currency: Optional[str] = "DKK") -> Dict[str, Any]:
     }
 
 
+# Serialized responses with their ETag, computed once per entry
+# search id -> (body, etag); searches whose detections are stored
+_search_cache = TTLCache(maxsize=1000, ttl=60)
+
+
 @router.get("/get-filters")
-def get_user(user: User = Depends(get_current_user)) -> Dict[str, Any]:
-    start_time = time.time()
+def get_user(
+    request: Request, user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Served from the facet catalogue: the response bytes for the user's
+    gender and country are built once per catalogue version.
+    """
+
+    def build(catalogue: FacetCatalogue) -> bytes:
+        filters: List[Dict[str, Any]] = []
+        filters += get_brand_filters(catalogue.brands)
+        filters += get_gender_filters(user.gender)
+        filters += get_listers_filters(catalogue.listers.get(user.country, []))
+        # filters.append(get_price_filter(user.currency))
+
+        return orjson.dumps({"filters": filters})
+
+    key = (user.gender, user.country)
+    return etag_response(request, *facet_catalogue.response(key, build))
+
+
+@router.post("/refresh-filters", dependencies=[Depends(require_service_key)])
+def refresh_filters() -> Dict[str, Any]:
+    """
+    Reload the facet catalogue now, e.g. after a feed import, instead of
+    waiting for the background refresh. For the import jobs only (requires
+    the X-Service-Key header). Full rebuilds are limited to one a minute;
+    more frequent calls refresh incrementally.
+    """
+    full = time.time() - facet_catalogue.last_full >= 60
+    changed = facet_catalogue.refresh(full=full)
+    return {"changed": changed, "version": facet_catalogue.version}
+
+
+def _enrich_products(product_ids: List[str]):
+    try:
+        enrich_payload(qdrant, supabase, "tbnetv1_vectors", product_ids)
+    except Exception as e:
+        logger.warning(f"Search payload update failed for {product_ids}: {e}")
 
-    filters: List[Dict[str, Any]] = []
-    filters += get_brand_filters()
-    filters += get_gender_filters(user.gender)
-    filters += get_listers_filters(user.country)
-    # filters.append(get_price_filter(user.currency))
 
-    return JSONResponse(
-        content={"filters": filters}, media_type="application/json; charset=utf-8"
+@router.post("/products-updated", dependencies=[Depends(require_service_key)])
+def products_updated(
+    update: ProductsUpdated, background_tasks: BackgroundTasks
+) -> Dict[str, Any]:
+    """
+    Called by ingestion after products' listings, prices or images changed:
+    drops them from the product cache so searches and liked lists show the
+    new data right away instead of after PRODUCT_CACHE_TTL, and rewrites
+    their search filter payload (brand, in-stock shops, prices) in Qdrant
+    in the background. Without product_ids the whole cache is dropped; the
+    payload of the whole collection is rebuilt with
+    `python -m services.search_payload`. Requires the X-Service-Key header.
+    """
+    if update.product_ids is None:
+        clear_product_cache()
+    else:
+        invalidate_products(update.product_ids)
+        if update.product_ids:
+            background_tasks.add_task(_enrich_products, update.product_ids)
+    return {"success": True}
+
+
+@router.post("/update-profile")
+def update_profile(
+    profile: ProfileUpdate, user: User = Depends(get_current_user)
+) -> Dict[str, Any]:
+    """
+    Change the user's country (ISO 3166 alpha-2 code) and/or currency (one
+    we have rates for). The cached profile is dropped so the next request
+    already uses the new values.
+    """
+    changes = {k: v.upper() for k, v in profile.model_dump(exclude_none=True).items()}
+    if not changes:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    if "country" in changes and changes["country"] not in COUNTRY_CODES:
+        raise HTTPException(status_code=400, detail="Unknown country")
+    if "currency" in changes and changes["currency"] not in currency_rates.index:
+        raise HTTPException(status_code=400, detail="Unsupported currency")
+
+    result = (
+        supabase.schema("tb2")
+        .table("users")
+        .update(changes)
+        .eq("id", user.id)
+        .execute()
     )
+    if not result.data:
+        raise HTTPException(status_code=404, detail="User not found")
+    invalidate_user(user.id)
+
+    return {"success": True, **changes}
 
 
 @router.get("/get-details")
@@ -137,9 +222,14 @@ def get_user(user: User = Depends(get_current_user)) -> Dict[str, Any]:
 
 @router.get("/get-search")
 def get_search(
+    request: Request,
     search_id: str,
     user: User = Depends(get_current_user),
 ) -> Dict[str, Any]:
+    cached = _search_cache.get(search_id)
+    if cached is not None:
+        return etag_response(request, *cached)
+
     start_time = time.time()
 
     detection = (
@@ -152,15 +242,27 @@ def get_search(
     query_time = time.time() - start_time
     print(f"Time to get search data: {query_time:.4f} seconds")
 
-    return detection.data
+    body = orjson.dumps(detection.data)
+    cached = (body, make_etag(body))
+    # a search without detections may still be processing, don't cache it
+    if detection.data.get("detections"):
+        _search_cache[search_id] = cached
+
+    return etag_response(request, *cached)
 
 
 @router.get("/onboarding")
-def get_onboarding_options() -> Dict[str, List[Dict[str, Any]]]:
+def get_onboarding_options(request: Request) -> Dict[str, List[Dict[str, Any]]]:
     """
     Returns onboarding options for country, gender, and currency.
     Does not require authentication.
     """
+    return etag_response(request, *_onboarding_body())
+
+
+@lru_cache(maxsize=1)
+def _onboarding_body() -> tuple[bytes, str]:
+    """The options never change while running: serialized once, with the ETag."""
 
     # which countries & currencies we actually want to show
     VISIBLE_COUNTRIES = {"DK", "SE", "DE", "NO"}
@@ -204,7 +306,7 @@ def get_onboarding_options() -> Dict[str, List[Dict[str, Any]]]:
             }
         )
 
-    return JSONResponse(
-        {"country": countries, "gender": genders, "currency": currencies},
-        media_type="application/json; charset=utf-8",
+    body = orjson.dumps(
+        {"country": countries, "gender": genders, "currency": currencies}
     )
+    return body, make_etag(body)
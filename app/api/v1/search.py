@@ -1,28 +1,63 @@
+import asyncio
 import hashlib
 import json
-from typing import Any, Dict, List
-
+import math
+import os
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, Optional
 
 from cachetools import TTLCache
-
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse
 
 from api.v1.like import mark_liked_products
 from dependencies import User, get_current_user
-from services.product_search import vectorSearch
-
-from services.cloud import supabase
+from services.product_search import (
+    SearchFilters,
+    vectorSearchAsync,
+    vectorSearchBatch,
+)
+
+from services.cloud import postgrest_select
+from services.etags import etag_response, make_etag
+from services.product_hydration import group_product, hydrate_products
+from services.result_cache import make_cache
+from services.single_flight import SingleFlight
 
-from currency_converter import CurrencyConverter
 import logging
 
 logger = logging.getLogger(__name__)
-convertCurrency = CurrencyConverter().convert
 
 router = APIRouter()
 
 
+def _rank_products(
+    grouped: Dict[str, Dict[str, Any]],
+    product_conf: Dict[str, float],
+    start: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Order grouped products by similarity and add the per-search fields.
+    `start` is the position of the first product when ranking a page.
+    """
+    # order by similarity
+    ordered = sorted(
+        grouped.values(),
+        key=lambda p: product_conf.get(p["id"], 0),
+        reverse=True,
+    )
+
+    return [
+        {
+            **p,
+            "confidence": round(product_conf.get(p["id"], 0), 10),
+            "index": start + i,  # Added index property
+        }
+        for i, p in enumerate(ordered)
+    ]
+
+
 def _group_products(
     raw_products: List[Dict[str, Any]],
     product_conf: Dict[str, float],
@@ -32,154 +67,393 @@ def _group_products(
     Convert the flat response coming from Supabase into the shape expected
     by the client. All heavy grouping has already been done in SQL.
     """
-    products: List[Dict[str, Any]] = []
+    grouped = {p["id"]: group_product(p, currency) for p in raw_products}
+    return _rank_products(grouped, product_conf)
 
-    # order by similarity
-    raw_products.sort(
-        key=lambda p: product_conf.get(p["id"], 0),
-        reverse=True,
-    )
 
-    for i, p in enumerate(raw_products):
-        imgs = sorted(p.get("product_images") or [], key=lambda i: i.get("sort", 0))
-        img_urls = [
-            f"https://trendbook.s3.eu-west-1.amazonaws.com/{img['s3_key']}"
-            for img in imgs
-            if img.get("s3_key")
-        ]
+def _bucket_width(top: float, buckets: int = 10) -> float:
+    """Smallest 1/2/2.5/5 x 10^n width that covers 0..top in `buckets` steps."""
+    target = top / buckets
+    scale = 10 ** math.floor(math.log10(target)) if target > 0 else 1
+    for step in (1, 2, 2.5, 5, 10):
+        if step * scale >= target:
+            return step * scale
+    return 10 * scale
+
 
-        # ---------- listings ----------
-        listings = p.get("v_product_listings", [])
-        feed_listings: Dict[str, Dict[str, Any]] = {}
-
-        # Track the cheapest *in-stock* price while we build the feeds
-        cheapest_price: float | None = None
-
-        for lst in listings:
-            if not lst.get("in_stock") or lst.get("price") is None:
-                # skip out-of-stock or price-less variants everywhere
-                continue
-
-            feed_name = lst["feeds"]["name"]
-
-            converted_price = round(
-                convertCurrency(lst["price"], lst["currency"], currency), 2
-            )
-
-            # update cheapest price once, not twice
-            if cheapest_price is None or converted_price < cheapest_price:
-                cheapest_price = converted_price
-
-            if feed_name not in feed_listings:
-                feed_listings[feed_name] = {
-                    **lst["feeds"],
-                    "price_original": converted_price,  # for display
-                    "price": converted_price,  # effective selling price
-                    "compare_price": (
-                        round(
-                            convertCurrency(
-                                lst["compare_price"], lst["currency"], currency
-                            ),
-                            2,
-                        )
-                        if lst["compare_price"] is not None
-                        else None
-                    ),
-                    "original_currency": lst["currency"],
-                    "currency": currency,
-                    "link": lst["affiliate_url"],
-                    "sizes": [],
-                }
-
-            # add the size only if we actually have one
-            size = lst.get("variant", {}).get("size")
-            if size:
-                feed_listings[feed_name]["sizes"].append(size)
-
-        products.append(
+def _facets(products: Iterable[Dict[str, Any]], currency: str) -> Dict[str, Any]:
+    """
+    Brand, shop and price facet counts of grouped products: each product
+    counts once per brand, once per shop listing it and once in the price
+    bucket of its from_price.
+    """
+    brands: Counter = Counter()
+    shops: Counter = Counter()
+    shop_names: Dict[Any, str] = {}
+    prices: List[float] = []
+
+    for p in products:
+        if p.get("brand"):
+            brands[p["brand"]] += 1
+        for listing in p["listings"]:
+            shop_id = listing.get("id", listing["name"])
+            shops[shop_id] += 1
+            shop_names[shop_id] = listing["name"]
+        if p["from_price"] is not None:
+            prices.append(p["from_price"])
+
+    buckets = []
+    if prices:
+        width = _bucket_width(max(prices))
+        counts = Counter(int(price // width) for price in prices)
+        buckets = [
             {
-                "id": p["id"],
-                "brand": p["brand"],
-                "from_price": cheapest_price,  # now only in-stock / converted once
-                "currency": currency,
-                "listings": list(feed_listings.values()),
-                "images": img_urls,
-                "confidence": round(product_conf.get(p["id"], 0), 10),
-                "index": i,  # Added index property
+                "min": round(i * width, 2),
+                "max": round((i + 1) * width, 2),
+                "count": counts[i],
             }
-        )
+            for i in range(max(counts) + 1)
+        ]
+
+    return {
+        "brand": [{"value": b, "count": n} for b, n in brands.most_common()],
+        "lister": [
+            {"value": s, "label": shop_names[s].upper(), "count": n}
+            for s, n in shops.most_common()
+        ],
+        "price": {"currency": currency, "buckets": buckets},
+    }
+
+
+def _confidence(vectors: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Confidence per product, taken from its best ranked image."""
+    confidence: Dict[str, float] = {}
+    for v in vectors:
+        pid = v["product_id"]
+        if pid not in confidence:
+            confidence[pid] = 1.0 / (1 + v["distance"])
+    return confidence
 
-    return products
 
+# ranked product ids with their confidence, best first; products are
+# hydrated per request (and per page) from the product cache
+search_detection_cache = make_cache(
+    "search_detection", maxsize=1000, ttl=300
+)  # 5 min expiry
 
-search_detection_cache = TTLCache(maxsize=1000, ttl=300)  # 5 min expiry
 
+# "<cache key>:<currency>" -> facets of the whole ranking, same lifetime
+search_facets_cache = make_cache("search_facets", maxsize=1000, ttl=300)
 
-def _cache_key(detection_id: str, gender: str) -> str:
+
+async def _cache_ranking(cache_key: str, ranking: Dict[str, float]):
+    await search_detection_cache.aset(cache_key, ranking)
+    return ranking
+
+
+def _cache_key(detection_id: str, gender: str, **overrides) -> str:
     base = {"detection_id": detection_id, "gender": gender}
+    base.update({k: v for k, v in overrides.items() if v is not None})
     return hashlib.sha256(json.dumps(base, sort_keys=True).encode()).hexdigest()
 
 
+# In-flight searches by cache key
+_search_flight = SingleFlight()
+
+
+async def _search_ranking(
+    cache_key: str,
+    detection_id: str,
+    gender: str,
+    filters: SearchFilters,
+    overrides: Dict[str, Any],
+) -> Optional[Dict[str, float]]:
+    """
+    Search a detection and cache its ranking; None if the detection doesn't
+    exist.
+    """
+    # 1) fetch detection
+    rows = await postgrest_select(
+        "detections", {"select": "embedding,label", "id": f"eq.{detection_id}"}
+    )
+    det = rows[0] if rows else {}
+
+    if not det:
+        return None
+
+    # 2) vector search
+    vectors = await vectorSearchAsync(
+        vector=det["embedding"],
+        label=det["label"],
+        gender=gender,
+        filters=filters,
+        **overrides,
+    )
+
+    ranking = _confidence(vectors)
+
+    # Cache the full ranking
+    return await _cache_ranking(cache_key, ranking)
+
+
 @router.get("/search-detection")
-def search_detection(
+async def search_detection(
     detection_id: str,
     gender: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=2, le=1000),
+    k1: Optional[int] = Query(None, ge=1),
+    k2: Optional[int] = Query(None, ge=1),
+    lambda_value: Optional[float] = Query(None, ge=0, le=1),
+    adaptive: Optional[bool] = None,
+    page_size: Optional[int] = Query(None, ge=1, le=200),
+    cursor: Optional[str] = None,
+    brand: Optional[List[str]] = Query(None),
+    lister: Optional[List[str]] = Query(None),
+    price_min: Optional[float] = Query(None, ge=0),
+    price_max: Optional[float] = Query(None, ge=0),
+    facets: bool = False,
     user: User = Depends(get_current_user),
 ) -> Dict[str, Any]:
-    cache_key = _cache_key(detection_id, gender)
-    cached = search_detection_cache.get(cache_key)
-    if cached:
+    """
+    Search products for a detection. The optional parameters override the
+    search settings (candidate depth, rerank k1/k2/lambda); `adaptive`
+    shrinks or skips the rerank when the ANN scores show a clear winner.
+
+    With `page_size` only one page is hydrated and returned, together with
+    `next_cursor` for the following page (null on the last one) and `total`.
+    Later pages are served from the cached ranking without searching again.
+
+    `brand`, `lister` (feed ids) and `price_min`/`price_max` (in the user's
+    currency) are the /get-filters selections. They are applied in the
+    Qdrant query, so every candidate matches and pages come back full.
+    They match against the brand, feed_ids and min_price payload of the
+    points, which has to be written once with `python -m
+    services.search_payload` and is kept current by /products-updated.
+
+    With `facets` the response also has brand, shop (lister) and price
+    bucket counts over all results, prices in the user's currency, so the
+    UI can show and apply filters without another call. They are computed
+    once per cached ranking and currency.
+
+    Product prices (page and facets) are in the user's currency.
+
+    Responses carry an ETag of their content; send it back as If-None-Match
+    to get a 304 while neither the ranking nor its products have changed.
+    """
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if start < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    overrides = {
+        "limit": limit,
+        "k1": k1,
+        "k2": k2,
+        "lambda_value": lambda_value,
+        "adaptive": adaptive,
+    }
+    filters = SearchFilters(
+        brands=tuple(sorted(set(brand or []))),
+        feed_ids=tuple(sorted(set(lister or []))),
+        currency=user.currency or "DKK",
+        min_price=price_min,
+        max_price=price_max,
+    )
+    cache_key = _cache_key(
+        detection_id,
+        gender,
+        **overrides,
+        brand=list(filters.brands) or None,
+        lister=list(filters.feed_ids) or None,
+        price_min=price_min,
+        price_max=price_max,
+        price_currency=(
+            filters.currency
+            if price_min is not None or price_max is not None
+            else None
+        ),
+    )
+    ranking = await search_detection_cache.aget(cache_key)
+    if cache_key not in _requested:
+        _requested[cache_key] = True
+        _first_requests["warm" if ranking is not None else "cold"] += 1
+
+    if ranking is not None:
         logger.info(f"Cache hit for detection_id={detection_id}, gender={gender}")
+    else:
+        # identical requests arriving meanwhile wait for this search
+        ranking = await _search_flight.do(
+            cache_key,
+            _search_ranking,
+            cache_key,
+            detection_id,
+            gender,
+            filters,
+            overrides,
+        )
+        if ranking is None:
+            return {"products": []}
+
+    product_ids = list(ranking)
+    end = start + page_size if page_size else len(product_ids)
+    currency = user.currency or "DKK"
+
+    # 3) product fetch for this page (cached products skip the fetch and the
+    # regrouping). Uncached facets need every product of the ranking, so
+    # those are hydrated once and the page is taken from them.
+    page_ids = product_ids[start:end]
+    facets_key = f"{cache_key}:{currency}"
+    result_facets = await search_facets_cache.aget(facets_key) if facets else None
+    if facets and result_facets is None:
+        everything = await hydrate_products(product_ids, currency)
+        result_facets = _facets(everything.values(), currency)
+        await search_facets_cache.aset(facets_key, result_facets)
+        grouped = {pid: everything[pid] for pid in page_ids if pid in everything}
+    else:
+        grouped = await hydrate_products(page_ids, currency)
+
+    products = _rank_products(grouped, ranking, start)
+    products = await mark_liked_products(products, user.id)
+    result: Dict[str, Any] = {"products": products}
+    if page_size:
+        result["next_cursor"] = str(end) if end < len(product_ids) else None
+        result["total"] = len(product_ids)
+    if facets:
+        result["facets"] = result_facets
+
+    # Serialize straight to bytes (skips jsonable_encoder). The ETag is the
+    # hash of the body, so it changes with the products' prices, stock and
+    # images and with the facets, not only with the ranking
+    body = orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS)
+    return etag_response(request, body, make_etag(body))
+
+
+@router.get("/search-search")
+async def search_search(
+    search_id: str,
+    gender: str,
+    user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Search every detection of a search (photo) at once: one detection query,
+    one Qdrant batch search and one product query for the union of results.
+    """
+    detections, confidences, grouped = await _search_detections(
+        search_id, gender, user.currency or "DKK"
+    )
 
-        return cached
+    if not detections:
+        return {"detections": []}
 
-    # 1) fetch detection
-    det = (
-        supabase.table("detections")
-        .select("embedding, label")
-        .eq("id", detection_id)
-        .single()
-        .execute()
-    ).data or {}
+    results = []
+    for det, confidence in zip(detections, confidences):
+        det_products = {pid: grouped[pid] for pid in confidence if pid in grouped}
+        products = _rank_products(det_products, confidence)
+        results.append({"detection_id": det["id"], "products": products})
 
-    if not det:
-        return {"products": []}
+    await mark_liked_products([p for r in results for p in r["products"]], user.id)
 
-    # 2) vector search
-    vectors = vectorSearch(vector=det["embedding"], label=det["label"], gender=gender)
+    return ORJSONResponse({"detections": results})
 
-    ranks = {}
-    confidence = {}
-    for i, v in enumerate(vectors):
-        pid = v["product_id"]
-        if pid not in ranks:
-            ranks[pid] = i
-            confidence[pid] = 1.0 / (1 + v["distance"])
 
-    product_ids = list(ranks)
-
-    # 3) product fetch
-    prod = (
-        (
-            supabase.table("products")
-            .select(
-                """
-                id, brand,
-                product_images(url, s3_key, sort),
-                v_product_listings:shop_listings!inner(*, variant(size), feeds(name, domain, bf_logo))
-                """
-            )
-            .in_("id", product_ids)
-            .execute()
-        ).data
-        or []
+async def _search_detections(search_id: str, gender: str, currency: str = "DKK"):
+    """
+    Rankings of every detection of a search, cached per detection, and their
+    products hydrated in one fetch in `currency`: (detections, confidences,
+    grouped).
+    """
+    # 1) fetch all detections
+    detections = await postgrest_select(
+        "detections", {"select": "id,embedding,label", "search": f"eq.{search_id}"}
     )
 
-    products = _group_products(prod, confidence)
-    products = mark_liked_products(products, user.id)
-    result = {"products": products}
+    if not detections:
+        return [], [], {}
+
+    # 2) batched vector search
+    batch = await vectorSearchBatch(detections, gender=gender)
+    confidences = [_confidence(vectors) for vectors in batch]
+
+    for det, confidence in zip(detections, confidences):
+        await _cache_ranking(_cache_key(det["id"], gender), confidence)
+
+    # 3) one product fetch for all detections
+    product_ids = list({pid for conf in confidences for pid in conf})
+    grouped = await hydrate_products(product_ids, currency)
+
+    return detections, confidences, grouped
+
+
+# Searches (search_id, gender, currency) waiting to be warmed, newest last. When the
+# queue is full the oldest waiting search is dropped.
+WARM_QUEUE_SIZE = int(os.getenv("WARM_QUEUE_SIZE", "100"))
+_warm_queue: deque = deque(maxlen=WARM_QUEUE_SIZE)
+_warm_ready = asyncio.Event()
+_warm_task: Optional[asyncio.Task] = None
+_warm_counts = {"queued": 0, "dropped": 0, "warmed": 0, "failed": 0}
+
+# Cache keys already requested, to tell a detection's first request apart;
+# first requests are counted by whether they found the ranking cached
+_requested = TTLCache(maxsize=50000, ttl=3600)
+_first_requests = {"warm": 0, "cold": 0}
+
+
+async def _warm_worker():
+    while True:
+        while not _warm_queue:
+            _warm_ready.clear()
+            await _warm_ready.wait()
+
+        search_id, gender, currency = _warm_queue.pop()  # newest first
+        try:
+            await _search_detections(search_id, gender, currency)
+            _warm_counts["warmed"] += 1
+        except Exception as e:
+            _warm_counts["failed"] += 1
+            logger.warning(f"Warming search {search_id} failed: {e!r}")
 
-    # Cache full result
-    search_detection_cache[cache_key] = result
 
-    return result
+def enqueue_warm(search_id: str, gender: str, currency: str = "DKK"):
+    """Queue a search for warming and make sure the worker is running."""
+    global _warm_task
+
+    item = (search_id, gender, currency)
+    if item in _warm_queue:
+        _warm_queue.remove(item)
+    elif len(_warm_queue) == _warm_queue.maxlen:
+        _warm_counts["dropped"] += 1
+    _warm_queue.append(item)
+    _warm_counts["queued"] += 1
+    _warm_ready.set()
+
+    if _warm_task is None or _warm_task.done():
+        _warm_task = asyncio.create_task(_warm_worker())
+
+
+def warm_stats() -> Dict[str, Any]:
+    first = _first_requests["warm"] + _first_requests["cold"]
+    return {
+        **_warm_counts,
+        "waiting": len(_warm_queue),
+        "first_requests": first,
+        "first_requests_warm": _first_requests["warm"],
+        "first_request_warm_rate": _first_requests["warm"] / first if first else 0.0,
+    }
+
+
+@router.post("/warm-search")
+async def warm_search(
+    search_id: str,
+    gender: str,
+    user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Search every detection of a new search in the background so its first
+    /search-detection and /search-search are served from the caches.
+    Call it as soon as the search's detections are stored.
+    """
+    enqueue_warm(search_id, gender, user.currency or "DKK")
+    return {"queued": True}
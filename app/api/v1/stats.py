@@ -0,0 +1,29 @@
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+
+from api.v1.search import warm_stats
+from dependencies import require_service_key, user_cache_stats
+from services.product_search import rerank_stats
+from services.result_cache import cache_stats
+from services.vector_cache import vector_cache
+
+router = APIRouter()
+
+
+@router.get("/cache-stats", dependencies=[Depends(require_service_key)])
+def get_cache_stats() -> Dict[str, Any]:
+    """
+    Size and hit rate of each result cache (hits/misses of this worker), the
+    user-profile background refreshes, the search warm-up queue with its
+    first-request warm rate, and the rerank queue (searches rejected with 503
+    when it was full). For monitoring only (requires the X-Service-Key
+    header).
+    """
+    return {
+        **cache_stats(),
+        "user_meta": user_cache_stats(),
+        "vector": vector_cache.stats(),
+        "warm": warm_stats(),
+        "rerank": rerank_stats(),
+    }
@@ -0,0 +1,91 @@
+"""
+Microbenchmark of the per-request auth overhead of get_current_user.
+
+Signs tokens locally (HS256 with a throwaway secret, ES256 with a throwaway
+key served as a JWKS) and times local verification, cold and from the
+claims cache. The remote Supabase Auth call the local path replaces is
+timed too when --token is given a real access token.
+
+    cd app && python benchmark_auth.py
+    cd app && python benchmark_auth.py --token "$ACCESS_TOKEN"
+"""
+
+import argparse
+import json
+import time
+import uuid
+
+import jwt
+import numpy as np
+
+from services.auth import TokenVerifier
+
+
+def _token(key, alg: str, kid: str = None) -> str:
+    now = int(time.time())
+    claims = {
+        "sub": str(uuid.uuid4()),
+        "aud": "authenticated",
+        "role": "authenticated",
+        "iat": now,
+        "exp": now + 3600,
+    }
+    headers = {"kid": kid} if kid else None
+    return jwt.encode(claims, key, algorithm=alg, headers=headers)
+
+
+def _time(fn, args: list) -> list[float]:
+    samples = []
+    for a in args:
+        start = time.perf_counter()
+        fn(a)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _es256_verifier() -> tuple[TokenVerifier, object]:
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private.public_key()))
+    jwk.update({"kid": "bench", "alg": "ES256", "use": "sig"})
+
+    verifier = TokenVerifier(secret=None, jwks_url="http://jwks.invalid")
+    # serve the JWKS from memory instead of fetching it
+    verifier.jwks.fetch_data = lambda: {"keys": [jwk]}
+    return verifier, private
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--token", help="real access token to time the remote call")
+    args = parser.parse_args()
+
+    secret = uuid.uuid4().hex
+    hs = TokenVerifier(secret=secret, jwks_url=None)
+    es, private = _es256_verifier()
+
+    hs_tokens = [_token(secret, "HS256") for _ in range(args.requests)]
+    es_tokens = [_token(private, "ES256", "bench") for _ in range(args.requests)]
+
+    cases = {
+        "HS256 verify": _time(hs.verify, hs_tokens),
+        "HS256 cached": _time(hs.verify, hs_tokens),
+        "ES256 verify": _time(es.verify, es_tokens),
+        "ES256 cached": _time(es.verify, es_tokens),
+    }
+
+    if args.token:
+        from dependencies import _remote_user_id
+
+        cases["remote get_user"] = _time(_remote_user_id, [args.token] * 20)
+
+    print(f"{'path':<18}{'p50 us':>10}{'p95 us':>10}")
+    for name, samples in cases.items():
+        p50, p95 = np.percentile(samples, [50, 95])
+        print(f"{name:<18}{p50:>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Throughput of /search-detection under concurrent clients, async path versus
+the blocking one it replaced.
+
+Both paths run in process against stubs with injected latency: Qdrant answers
+after --qdrant-latency seconds, every PostgREST call (detection, products,
+liked products) after --db-latency. The rerank, grouping and serialization
+are the real code.
+
+    async     the /search-detection endpoint of the app: AsyncQdrantClient,
+              httpx PostgREST, rerank off the event loop
+    blocking  the previous flow as a sync endpoint: sync Qdrant client and
+              blocking Supabase calls, one threadpool slot per request
+
+Every request searches a new detection with a new embedding, so the ranking
+and semantic caches never hit; the product cache is off unless
+--product-cache is given. No network calls are made.
+
+    cd app && python benchmark_concurrency.py
+    cd app && python benchmark_concurrency.py --clients 50 200 --requests 5
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+import httpx
+import numpy as np
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+
+import main
+from api.v1.search import _confidence, _group_products
+from benchmark_search import synthetic_hits, synthetic_products
+from dependencies import User, get_current_user
+from services import cloud, product_hydration, product_search
+from services.cloud import postgrest_in
+
+DIM = 512
+
+
+class AsyncStubQdrant:
+    def __init__(self, hits, latency: float):
+        self.hits = hits
+        self.latency = latency
+
+    async def search(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.hits[: kwargs.get("limit", len(self.hits))]
+
+
+class StubQdrant:
+    def __init__(self, hits, latency: float):
+        self.hits = hits
+        self.latency = latency
+
+    def search(self, **kwargs):
+        time.sleep(self.latency)
+        return self.hits[: kwargs.get("limit", len(self.hits))]
+
+
+def _embedding() -> list[float]:
+    return np.random.default_rng().normal(size=DIM).tolist()
+
+
+def _ids(in_filter: str) -> list[str]:
+    # in.("p1","p2",...)
+    return [v.strip('"') for v in in_filter[4:-1].split(",") if v]
+
+
+def _postgrest_response(products: dict, request: httpx.Request) -> httpx.Response:
+    """Stub PostgREST; `products` are pre-encoded rows, as the database sends."""
+    table = request.url.path.rsplit("/", 1)[-1]
+    if table == "detections":
+        body = orjson.dumps([{"embedding": _embedding(), "label": "shirt"}])
+    elif table == "products":
+        ids = _ids(request.url.params["id"])
+        body = b"[" + b",".join(products[pid] for pid in ids if pid in products) + b"]"
+    else:
+        body = b"[]"
+    return httpx.Response(
+        200, content=body, headers={"content-type": "application/json"}
+    )
+
+
+def stub_postgrest(products: dict, latency: float) -> httpx.AsyncClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        return _postgrest_response(products, request)
+
+    return httpx.AsyncClient(
+        base_url="http://postgrest.invalid/rest/v1",
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def blocking_app(products: dict, latency: float) -> FastAPI:
+    """The previous flow, with the same stubbed responses (and JSON decoding)."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        time.sleep(latency)
+        return _postgrest_response(products, request)
+
+    db = httpx.Client(
+        base_url="http://postgrest.invalid/rest/v1",
+        transport=httpx.MockTransport(handler),
+    )
+    app = FastAPI()
+
+    @app.get("/api/v1/search-detection")
+    def search_detection(detection_id: str, gender: str):
+        det = db.get("/detections", params={"id": f"eq.{detection_id}"}).json()[0]
+        vectors = product_search.vectorSearch(
+            vector=det["embedding"], label=det["label"], gender=gender
+        )
+        confidence = _confidence(vectors)
+        raw = db.get("/products", params={"id": postgrest_in(confidence)}).json()
+        result = {"products": _group_products(raw, confidence)}
+        db.get("/liked_products", params={"user": "eq.user"}).json()
+        return ORJSONResponse(result)
+
+    return app
+
+
+async def run_load(app, clients: int, requests: int) -> dict:
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench.invalid", timeout=None
+    ) as client:
+
+        async def worker(i: int):
+            for _ in range(requests):
+                start = time.perf_counter()
+                resp = await client.get(
+                    "/api/v1/search-detection",
+                    params={"detection_id": uuid.uuid4().hex, "gender": "female"},
+                    headers={"x-user": f"user{i}", "accept-encoding": "identity"},
+                )
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": float(np.percentile(ms, 50)),
+        "p95": float(np.percentile(ms, 95)),
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--requests", type=int, default=5, help="per client")
+    parser.add_argument("--candidates", type=int, default=200)
+    parser.add_argument("--qdrant-latency", type=float, default=0.03)
+    parser.add_argument("--db-latency", type=float, default=0.015)
+    parser.add_argument("--product-cache", action="store_true")
+    args = parser.parse_args()
+
+    random.seed(0)
+    hits, _ = synthetic_hits(np.random.default_rng(0), args.candidates)
+    product_ids = sorted({h.payload["product_id"] for h in hits})
+    products = {p["id"]: orjson.dumps(p) for p in synthetic_products(product_ids)}
+
+    product_search.qdrant = StubQdrant(hits, args.qdrant_latency)
+    product_search.async_qdrant = AsyncStubQdrant(hits, args.qdrant_latency)
+    cloud.async_postgrest = stub_postgrest(products, args.db_latency)
+    if not args.product_cache:
+        product_hydration._product_cache = TTLCache(maxsize=1, ttl=1)
+
+    def current_user(request: Request) -> User:
+        return User(id=request.headers["x-user"])
+
+    main.app.dependency_overrides[get_current_user] = current_user
+    apps = {"blocking": blocking_app(products, args.db_latency), "async": main.app}
+
+    # one event loop for all runs: the app's asyncio primitives bind to it
+    async def run_all():
+        print(f"{os.cpu_count()} CPU(s), {args.requests} requests per client")
+        print(f"{'clients':>8} {'path':<10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for clients in args.clients:
+            for name, app in apps.items():
+                r = await run_load(app, clients, args.requests)
+                print(
+                    f"{clients:>8} {name:<10}{r['rps']:>10.1f}"
+                    f"{r['p50']:>10.1f}{r['p95']:>10.1f}"
+                )
+
+    asyncio.run(run_all())
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,184 @@
+"""
+Offline benchmark of the search path on synthetic data.
+
+Generates clustered embeddings and Supabase-shaped product payloads, serves
+the candidates from a stubbed Qdrant client and times each stage of the
+search (gallery build, distances, rerank, hit formatting, product grouping,
+response serialization) plus vectorSearchAsync end to end. No network calls
+are made.
+
+    cd app && python benchmark_search.py
+    cd app && python benchmark_search.py --save baseline.json
+    cd app && python benchmark_search.py --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import numpy as np
+import orjson
+from fastapi.encoders import jsonable_encoder
+from qdrant_client.models import ScoredPoint
+
+from api.v1.search import _confidence, _group_products
+from services import product_search
+from services.reranking import gallery_distances, re_ranking
+
+SIZES = [50, 200, 1000]
+DIM = 512
+CURRENCIES = ["DKK", "SEK", "NOK", "EUR", "USD"]
+FEEDS = [
+    {"name": f"shop{i}", "domain": f"shop{i}.com", "bf_logo": f"logo{i}.png"}
+    for i in range(25)
+]
+
+
+def synthetic_hits(rng: np.random.Generator, n: int) -> tuple[list, list[float]]:
+    centers = rng.normal(size=(8, DIM))
+    vecs = centers[rng.integers(0, 8, n)] + rng.normal(scale=0.8, size=(n, DIM))
+    query = centers[0] + rng.normal(scale=0.8, size=DIM)
+
+    sims = vecs @ query / (np.linalg.norm(vecs, axis=1) * np.linalg.norm(query))
+    hits = [
+        ScoredPoint(
+            id=str(uuid.uuid4()),
+            version=0,
+            score=float(sims[i]),
+            payload={"product_id": f"p{i // 2}", "image_id": f"i{i}"},
+            vector=vecs[i].tolist(),
+        )
+        for i in np.argsort(-sims)
+    ]
+    return hits, query.tolist()
+
+
+def synthetic_products(product_ids: list[str]) -> list[dict]:
+    products = []
+    for pid in product_ids:
+        listings = []
+        for _ in range(random.randint(1, 40)):
+            price = round(random.uniform(50, 3000), 2)
+            listings.append(
+                {
+                    "in_stock": random.random() > 0.2,
+                    "price": price,
+                    "compare_price": price * 1.2 if random.random() > 0.5 else None,
+                    "currency": random.choice(CURRENCIES),
+                    "affiliate_url": f"https://example.com/{uuid.uuid4()}",
+                    "variant": {"size": random.choice(["XS", "S", "M", "L", "XL"])},
+                    "feeds": dict(random.choice(FEEDS)),
+                }
+            )
+        products.append(
+            {
+                "id": pid,
+                "brand": f"brand{random.randint(0, 300)}",
+                "product_images": [
+                    {"url": None, "s3_key": f"img/{pid}/{s}.jpg", "sort": s}
+                    for s in random.sample(range(8), random.randint(1, 8))
+                ],
+                "v_product_listings": listings,
+            }
+        )
+    return products
+
+
+class StubQdrant:
+    def __init__(self, hits):
+        self.hits = hits
+
+    async def search(self, **kwargs):
+        return self.hits[: kwargs.get("limit", len(self.hits))]
+
+
+def _time(fn, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def bench_size(n: int, repeat: int) -> dict[str, list[float]]:
+    rng = np.random.default_rng(n)
+    hits, vector = synthetic_hits(rng, n)
+    query_vec = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    gallery = np.array([h.vector for h in hits], dtype=np.float32)
+    q_g, q_q, g_g = gallery_distances(query_vec, gallery)
+    k1 = min(20, n - 1)
+    reranked = re_ranking(q_g, q_q, g_g, k1=k1, k2=min(6, k1))
+    results = product_search._format_hits(hits, reranked)
+    confidence = _confidence(results)
+    raw_products = synthetic_products(list(confidence))
+    products = {"products": _group_products(list(raw_products), confidence)}
+
+    stages = {
+        "gallery": lambda: np.array([h.vector for h in hits], dtype=np.float32),
+        "distances": lambda: gallery_distances(query_vec, gallery),
+        "rerank": lambda: re_ranking(q_g, q_q, g_g, k1=k1, k2=min(6, k1)),
+        "format_hits": lambda: product_search._format_hits(hits, reranked),
+        "group_products": lambda: _group_products(list(raw_products), confidence),
+        "serialize_json": lambda: json.dumps(jsonable_encoder(products)).encode(),
+        "serialize_orjson": lambda: orjson.dumps(products),
+    }
+    timings = {name: _time(fn, repeat) for name, fn in stages.items()}
+
+    product_search.async_qdrant = StubQdrant(hits)
+
+    def end_to_end():
+        product_search.vector_cache.clear()
+        asyncio.run(
+            product_search.vectorSearchAsync(vector, "shirt", "all", limit=n)
+        )
+
+    timings["vector_search"] = _time(end_to_end, repeat)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--save", help="write p50 timings to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to flag regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    random.seed(0)
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    summary = {}
+    regressions = []
+    print(f"{'candidates':>10} {'stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'baseline':>10}")
+    for n in SIZES:
+        for stage, samples in bench_size(n, args.repeat).items():
+            key = f"{n}/{stage}"
+            p50 = float(np.percentile(samples, 50))
+            p95 = float(np.percentile(samples, 95))
+            summary[key] = p50
+
+            base = baseline.get(key)
+            flag = ""
+            if base is not None and p50 > base * (1 + args.tolerance):
+                flag = "  REGRESSION"
+                regressions.append(key)
+            base_str = f"{base:>10.2f}" if base is not None else f"{'-':>10}"
+            print(f"{n:>10} {stage:<18}{p50:>10.2f}{p95:>10.2f}{base_str}{flag}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if regressions:
+        raise SystemExit(f"{len(regressions)} stage(s) regressed: {regressions}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,77 @@
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from fastapi import HTTPException, Security
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi.security import APIKeyHeader, HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
-from services.cloud import supabase  # Assuming this is your Supabase client
-from supabase import Client, create_client
-import os
+from services.cloud import supabase
 from dotenv import load_dotenv
 from cachetools import TTLCache
-
-# Max 100 users, 5 min TTL
-_user_meta_cache = TTLCache(maxsize=100, ttl=1)
+from services.auth import token_verifier
+from services.result_cache import make_cache
+from services.single_flight import ThreadSingleFlight
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Profiles are kept USER_CACHE_TTL seconds. Once older than USER_CACHE_REFRESH
+# they are still served, and refreshed in the background.
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "50000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600"))
+USER_CACHE_REFRESH = int(os.getenv("USER_CACHE_REFRESH", "300"))
+
+# user id -> (User, fetched at)
+_user_meta_cache = make_cache("user_meta", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+_user_meta_flight = ThreadSingleFlight()
+
+_refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="user-refresh")
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+_refresh_counts = {"refreshes": 0, "refresh_failures": 0}
+
 
 security = HTTPBearer()
 
-supabase: Client = create_client(
-    os.environ.get("SUPABASE_URL"),
-    os.environ.get("SUPABASE_KEY"),
-)
+# Credential of the internal jobs (feed imports, ingestion) for service-only
+# endpoints, sent as X-Service-Key. Those endpoints refuse every request
+# while it's unset.
+SERVICE_API_KEY = os.getenv("SERVICE_API_KEY")
+service_key_header = APIKeyHeader(name="X-Service-Key", auto_error=False)
+
+
+# Locally verified tokens are confirmed with Supabase Auth again after this
+# many seconds, to catch sessions revoked before exp (0: never)
+AUTH_RECHECK_SECONDS = int(os.getenv("AUTH_RECHECK_SECONDS", "0"))
+_remote_checked = TTLCache(maxsize=10000, ttl=max(AUTH_RECHECK_SECONDS, 1))
+
+
+def _remote_user_id(token: str) -> Optional[str]:
+    user = supabase.auth.get_user(token)
+    return user.user.id if user and hasattr(user, "user") and user.user else None
+
+
+def _token_user_id(token: str) -> Optional[str]:
+    """
+    User id of a valid token. Verified locally (claims cached until exp);
+    Supabase Auth is only asked when the token can't be verified locally or
+    is due for a revocation recheck.
+    """
+    claims = token_verifier.verify(token)
+    if claims is None:
+        return _remote_user_id(token)
+
+    if AUTH_RECHECK_SECONDS > 0 and token not in _remote_checked:
+        user_id = _remote_user_id(token)
+        if user_id:
+            _remote_checked[token] = True
+        return user_id
+
+    return claims["sub"]
 
 
 class User(BaseModel):
@@ -37,11 +89,8 @@ def get_current_user(
 
     token = credentials.credentials
 
-    # Try token cache
-
     try:
-        user = supabase.auth.get_user(token)
-        user_id = user.user.id if user and hasattr(user, "user") and user.user else None
+        user_id = _token_user_id(token)
         if not user_id:
             raise HTTPException(status_code=401, detail="User ID not found in token")
 
@@ -50,22 +99,79 @@ def get_current_user(
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
     # Try metadata cache
-    if user_id in _user_meta_cache:
-        return _user_meta_cache[user_id]
+    cached = _user_meta_cache.get(user_id)
+    if cached is not None:
+        user_model, fetched_at = cached
+        if time.time() - fetched_at > USER_CACHE_REFRESH:
+            _refresh_user_meta(user_id)
+        return user_model
+
+    # concurrent requests of the same user share one fetch
+    return _user_meta_flight.do(user_id, _fetch_user_meta, user_id)
+
+
+def require_service_key(key: Optional[str] = Security(service_key_header)):
+    if (
+        not SERVICE_API_KEY
+        or not key
+        or not hmac.compare_digest(key.encode(), SERVICE_API_KEY.encode())
+    ):
+        raise HTTPException(status_code=403, detail="Service key required")
 
+
+def _load_user_meta(user_id: str) -> User:
+    user_meta = (
+        supabase.schema("tb2")
+        .table("users")
+        .select("country, currency")
+        .eq("id", user_id)
+        .execute()
+    )
+    user_data = user_meta.data[0] if user_meta.data else {}
+    user_data["id"] = user_id
+    user_model = User(**user_data)
+    _user_meta_cache[user_id] = (user_model, time.time())  # Cache user profile
+    return user_model
+
+
+def _fetch_user_meta(user_id: str) -> User:
     try:
-        user_meta = (
-            supabase.schema("tb2")
-            .table("users")
-            .select("country, currency")
-            .eq("id", user_id)
-            .execute()
-        )
-        user_data = user_meta.data[0] if user_meta.data else {}
-        user_data["id"] = user_id
-        user_model = User(**user_data)
-        _user_meta_cache[user_id] = user_model  # Cache user profile
-        return user_model
+        return _load_user_meta(user_id)
     except Exception as e:
         print(f"User metadata fetch error: {e}")
         return User(id=user_id)
+
+
+def _refresh_user_meta(user_id: str):
+    """Reload a stale profile in the background; the stale one is kept on errors."""
+    with _refreshing_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+
+    def refresh():
+        try:
+            _user_meta_flight.do(user_id, _load_user_meta, user_id)
+            _refresh_counts["refreshes"] += 1
+        except Exception as e:
+            _refresh_counts["refresh_failures"] += 1
+            logger.warning(f"User metadata refresh failed for {user_id}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(user_id)
+
+    _refresh_pool.submit(refresh)
+
+
+def invalidate_user(user_id: str):
+    """Drop a cached profile, e.g. after the user changed country or currency."""
+    _user_meta_cache.pop(user_id)
+
+
+def user_cache_stats() -> dict:
+    return {
+        **_user_meta_cache.stats(),
+        **_refresh_counts,
+        "refresh_after": USER_CACHE_REFRESH,
+        "ttl": USER_CACHE_TTL,
+    }
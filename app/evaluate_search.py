@@ -0,0 +1,99 @@
+"""
+Offline evaluation of search settings against the full pipeline.
+
+For a sample of recent detections the Qdrant candidates are fetched once,
+then each settings variant is reranked on the same candidates and compared
+with the default (full) rerank: rerank latency vs agreement of the top-k.
+
+    cd app && python evaluate_search.py --sample 200 --gender female
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from services.cloud import supabase
+from services.product_search import (
+    DEFAULT_SETTINGS,
+    _rerank_hits,
+    _search_filter,
+    qdrant,
+    search_settings,
+)
+
+VARIANTS = {
+    "full": {},
+    "limit=100": {"limit": 100},
+    "limit=50": {"limit": 50},
+    "adaptive": {"adaptive": True},
+    "adaptive,gap=0.02": {"adaptive": True, "skip_gap": 0.02},
+    "adaptive,margin=0.08": {"adaptive": True, "depth_margin": 0.08},
+}
+
+
+def _top_products(results: list[dict], k: int) -> list:
+    top = []
+    for r in results:
+        if r["product_id"] not in top:
+            top.append(r["product_id"])
+        if len(top) == k:
+            break
+    return top
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", type=int, default=100)
+    parser.add_argument("--gender", default="all")
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    detections = (
+        supabase.table("detections")
+        .select("embedding, label")
+        .order("created_at", desc=True)
+        .limit(args.sample)
+        .execute()
+    ).data or []
+
+    timings = {name: [] for name in VARIANTS}
+    agreement = {name: [] for name in VARIANTS}
+
+    for det in detections:
+        hits = qdrant.search(
+            collection_name="tbnetv1_vectors",
+            query_vector=det["embedding"],
+            limit=DEFAULT_SETTINGS.limit,
+            query_filter=_search_filter(det["label"], args.gender),
+            with_vectors=True,
+            with_payload=True,
+        )
+        if len(hits) < 2:
+            continue
+
+        reference = None
+        for name, overrides in VARIANTS.items():
+            settings = search_settings(det["label"], **overrides)
+
+            start = time.perf_counter()
+            results = _rerank_hits(det["embedding"], hits[: settings.limit], settings)
+            timings[name].append(time.perf_counter() - start)
+
+            top = _top_products(results, args.k)
+            if reference is None:
+                reference = top
+            agreement[name].append(len(set(top) & set(reference)) / len(reference))
+
+    print(f"{len(timings['full'])} detections, top-{args.k} product agreement")
+    print(f"{'variant':<24}{'rerank ms (p50)':>16}{'p95':>10}{'agreement':>12}")
+    for name in VARIANTS:
+        ms = np.array(timings[name]) * 1000
+        print(
+            f"{name:<24}{np.percentile(ms, 50):>16.2f}"
+            f"{np.percentile(ms, 95):>10.2f}{np.mean(agreement[name]):>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,31 @@
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
 from api.v1 import router as v1_router
+from middleware import CompressionMiddleware
+from services.product_search import RerankBusy
 
 from dotenv import load_dotenv
 
 
 app = FastAPI(title="Fashion catalog API", version="1.0")
 
-app = FastAPI(default_response_class=JSONResponse)
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(CompressionMiddleware)
 
 is_running = False
 
 
+@app.exception_handler(RerankBusy)
+async def rerank_busy(request, exc: RerankBusy):
+    # shed load while the rerank queue is full; clients retry shortly
+    return ORJSONResponse(
+        {"detail": "Search is busy, try again"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
 app.include_router(v1_router, prefix="/api/v1")  # For editing feeds
 
 
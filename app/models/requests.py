@@ -2,3 +2,11 @@ from pydantic import BaseModel, HttpUrl
 from typing import Optional, Dict, Any, List, Union, Set
 from enum import Enum
 
+
+class ProfileUpdate(BaseModel):
+    country: Optional[str] = None
+    currency: Optional[str] = None
+
+
+class ProductsUpdated(BaseModel):
+    product_ids: Optional[List[str]] = None  # None: everything may have changed
@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+import jwt
+from cachetools import TLRUCache
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+# Legacy HS256 projects sign with the JWT secret; projects on asymmetric
+# signing keys publish them at the JWKS endpoint
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else "",
+)
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens locally: HS256 tokens against the project
+    JWT secret, asymmetric ones against the project's JWKS (fetched once and
+    cached, refetched when an unknown key id shows up).
+
+    verify() returns the claims, raises jwt.InvalidTokenError for a token
+    that is invalid or expired, and returns None when it can't tell (no
+    secret configured, key id not in the JWKS, JWKS unreachable) so the
+    caller can ask Supabase Auth instead. Verified claims are cached by
+    token hash until the token's exp.
+    """
+
+    def __init__(
+        self,
+        secret: Optional[str] = SUPABASE_JWT_SECRET,
+        jwks_url: Optional[str] = SUPABASE_JWKS_URL,
+        audience: str = SUPABASE_JWT_AUDIENCE,
+        cache_size: int = int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+    ):
+        self.secret = secret
+        self.audience = audience
+        self.jwks = (
+            jwt.PyJWKClient(jwks_url, cache_keys=True, lifespan=3600)
+            if jwks_url
+            else None
+        )
+        self._claims = TLRUCache(
+            maxsize=cache_size,
+            ttu=lambda _, claims, now: claims["exp"],
+            timer=time.time,
+        )
+
+    def _key(self, header: dict):
+        alg = header.get("alg")
+        if alg == "HS256":
+            return self.secret
+        if alg in ASYMMETRIC_ALGORITHMS and self.jwks is not None:
+            try:
+                return self.jwks.get_signing_key(header.get("kid")).key
+            except (jwt.PyJWKClientError, jwt.PyJWKSetError) as e:
+                logger.info(f"No local key for token kid={header.get('kid')}: {e}")
+        return None
+
+    def verify(self, token: str) -> Optional[dict]:
+        cache_key = hashlib.sha256(token.encode()).digest()
+        claims = self._claims.get(cache_key)
+        if claims is not None:
+            return claims
+
+        header = jwt.get_unverified_header(token)
+        key = self._key(header)
+        if key is None:
+            return None
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[header["alg"]],
+            audience=self.audience,
+            options={"require": ["exp", "sub"]},
+        )
+        self._claims[cache_key] = claims
+        return claims
+
+
+token_verifier = TokenVerifier()
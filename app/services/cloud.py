@@ -1,4 +1,6 @@
 import os
+
+import httpx
 from dotenv import load_dotenv
 from tbpy_cloud import supabaseClient, S3Bucket, PostgreSQL
 
@@ -11,9 +13,70 @@ AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
 AWS_REGION = os.getenv("AWS_REGION")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+SUPABASE_SCHEMA = os.getenv("SUPABASE_SCHEMA", "tb2")
 
 supabase = supabaseClient(url=SUPABASE_URL, key=SUPABASE_KEY)
 
+# Non-blocking PostgREST access for the async request paths
+async_postgrest = httpx.AsyncClient(
+    base_url=f"{SUPABASE_URL}/rest/v1",
+    headers={
+        "apikey": SUPABASE_KEY or "",
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Accept-Profile": SUPABASE_SCHEMA,
+    },
+    timeout=10,
+)
+
+
+def postgrest_in(values) -> str:
+    """Format values for a PostgREST `in.(...)` filter."""
+    return "in.(" + ",".join(f'"{v}"' for v in values) + ")"
+
+
+async def postgrest_select(table: str, params: dict) -> list[dict]:
+    resp = await async_postgrest.get(f"/{table}", params=params)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def postgrest_count(table: str, params: dict) -> int:
+    """Exact row count from a HEAD request; no rows are transferred."""
+    resp = await async_postgrest.head(
+        f"/{table}", params=params, headers={"Prefer": "count=exact"}
+    )
+    resp.raise_for_status()
+    # Content-Range: 0-24/3573, or */0 when nothing matches
+    return int(resp.headers["content-range"].rsplit("/", 1)[1])
+
+
+async def postgrest_insert(table: str, row: dict) -> list[dict]:
+    """Insert a row; returns the inserted rows."""
+    resp = await async_postgrest.post(
+        f"/{table}",
+        json=row,
+        headers={
+            "Content-Profile": SUPABASE_SCHEMA,
+            "Prefer": "return=representation",
+        },
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def postgrest_delete(table: str, params: dict) -> list[dict]:
+    """Delete the rows matching params; returns the deleted rows."""
+    resp = await async_postgrest.delete(
+        f"/{table}",
+        params=params,
+        headers={
+            "Content-Profile": SUPABASE_SCHEMA,
+            "Prefer": "return=representation",
+        },
+    )
+    resp.raise_for_status()
+    return resp.json()
+
 
 postgresql = PostgreSQL(database_url=os.getenv("DATABASE_URL"))
 
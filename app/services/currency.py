@@ -0,0 +1,68 @@
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+from currency_converter import CurrencyConverter, RateNotFoundError
+
+logger = logging.getLogger(__name__)
+
+
+class CurrencyRates:
+    """
+    Latest ECB rates loaded once into arrays, for converting many prices in
+    one numpy pass.
+
+    Matches CurrencyConverter.convert(amount, cur, new_cur) exactly: the
+    rates of both currencies are taken on the last date of `cur`, and the
+    amount is computed as amount / rate[cur] * rate[new_cur].
+    """
+
+    def __init__(self, converter: Optional[CurrencyConverter] = None):
+        converter = converter or CurrencyConverter()
+        self.currencies = sorted(converter.currencies)
+        self.index = {c: i for i, c in enumerate(self.currencies)}
+
+        n = len(self.currencies)
+        self.from_rate = np.full(n, np.nan)
+        self.to_rate = np.full((n, n), np.nan)  # [from, to], on from's last date
+        for i, cur in enumerate(self.currencies):
+            date = converter.bounds[cur].last_date
+            for j, new_cur in enumerate(self.currencies):
+                try:
+                    self.to_rate[i, j] = converter._get_rate(new_cur, date)
+                except RateNotFoundError:
+                    pass
+            self.from_rate[i] = self.to_rate[i, i]
+
+    def _indices(self, currencies: Sequence[str]) -> np.ndarray:
+        try:
+            return np.array([self.index[c] for c in currencies], dtype=np.intp)
+        except KeyError as e:
+            raise ValueError(f"{e.args[0]} is not a supported currency")
+
+    def convert(
+        self, amounts: Sequence[float], currencies: Sequence[str], new_currency: str
+    ) -> np.ndarray:
+        """Convert amounts[i] from currencies[i] to new_currency."""
+        src = self._indices(currencies)
+        dst = self._indices([new_currency])[0]
+
+        converted = np.asarray(amounts, dtype=np.float64) / self.from_rate[src]
+        converted *= self.to_rate[src, dst]
+
+        if np.isnan(converted).any():
+            bad = sorted({currencies[i] for i in np.flatnonzero(np.isnan(converted))})
+            raise RateNotFoundError(f"No {new_currency} rate for {', '.join(bad)}")
+        return converted
+
+    def convert_rounded(
+        self, amounts: Sequence[float], currencies: Sequence[str], new_currency: str
+    ) -> List[float]:
+        """convert(), rounded to 2 decimals with Python's round like before."""
+        if not len(amounts):
+            return []
+        converted = self.convert(amounts, currencies, new_currency)
+        return [round(x, 2) for x in converted.tolist()]
+
+
+currency_rates = CurrencyRates()
@@ -0,0 +1,56 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+JSON_TYPE = "application/json; charset=utf-8"
+
+# suffixes CompressionMiddleware adds to the ETag of compressed bodies
+_ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from bytes or strings, e.g. a cached body or entry version."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode())
+        h.update(b"\0")
+    return f'"{h.hexdigest()}"'
+
+
+def _matching_tag(request: Request, etag: str) -> Optional[str]:
+    """The If-None-Match tag that matches etag (in any encoding), if any."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*":
+        return etag
+
+    for tag in header.split(","):
+        tag = tag.strip()
+        opaque = tag[2:] if tag.startswith("W/") else tag
+        for suffix in _ENCODING_SUFFIXES:
+            if opaque.endswith(f'{suffix}"'):
+                opaque = opaque[: -len(suffix) - 1] + '"'
+                break
+        if opaque == etag:
+            return tag
+    return None
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 response when the client already has etag, else None."""
+    tag = _matching_tag(request, etag)
+    if tag is None:
+        return None
+    return Response(status_code=304, headers={"ETag": tag})
+
+
+def etag_response(
+    request: Request, body: bytes, etag: str, media_type: str = JSON_TYPE
+) -> Response:
+    """Serialized body with its ETag, or 304 if the client has it already."""
+    return not_modified(request, etag) or Response(
+        content=body, media_type=media_type, headers={"ETag": etag}
+    )
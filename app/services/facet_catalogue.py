@@ -0,0 +1,135 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from services.cloud import postgresql
+from services.etags import make_etag
+
+logger = logging.getLogger(__name__)
+
+# Incremental refresh (brands of products created since the watermark, all
+# feeds) every FACET_REFRESH_SECONDS; a full rebuild, which also drops brands
+# no product has any more, every FACET_FULL_REFRESH_SECONDS
+FACET_REFRESH_SECONDS = int(os.getenv("FACET_REFRESH_SECONDS", "300"))
+FACET_FULL_REFRESH_SECONDS = int(os.getenv("FACET_FULL_REFRESH_SECONDS", "3600"))
+
+
+class FacetCatalogue:
+    """
+    Brands and per-country shop (feed) lists for /get-filters, kept in
+    memory and refreshed by a background thread.
+
+    Responses are built by the caller through response(key, build) and kept
+    as serialized bytes with their ETag until the catalogue changes, so a
+    request is a dict lookup.
+    """
+
+    def __init__(self):
+        self.brands: List[str] = []
+        self.listers: Dict[str, List[Dict[str, Any]]] = {}  # country -> feeds
+        self.version = 0
+        self.watermark = None  # latest products.created_at seen
+        self.last_full = 0.0
+
+        self._responses: Dict[Hashable, Tuple[bytes, str]] = {}
+        self._lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_brands(self, full: bool) -> List[str]:
+        if full or self.watermark is None:
+            rows = postgresql.direct_query(
+                "SELECT brand, MAX(created_at) AS latest FROM tb2.products "
+                "GROUP BY brand;"
+            )
+            brands = set()
+        else:
+            rows = postgresql.direct_query(
+                "SELECT brand, MAX(created_at) AS latest FROM tb2.products "
+                "WHERE created_at > %s GROUP BY brand;",
+                params=(self.watermark,),
+            )
+            brands = set(self.brands)
+
+        for row in rows:
+            if row["brand"]:
+                brands.add(row["brand"])
+            if row["latest"] is not None and (
+                self.watermark is None or row["latest"] > self.watermark
+            ):
+                self.watermark = row["latest"]
+
+        return sorted(brands, key=str.casefold)
+
+    def _load_listers(self) -> Dict[str, List[Dict[str, Any]]]:
+        rows = postgresql.direct_query(
+            "SELECT id, name, bf_logo, markets FROM tb2.feeds "
+            "WHERE status = 'ACTIVE' ORDER BY id;"
+        )
+        listers: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            if not row["name"]:
+                continue
+            lister = {"id": row["id"], "name": row["name"], "icon": row["bf_logo"]}
+            for country in row["markets"] or []:
+                listers.setdefault(country, []).append(lister)
+        return listers
+
+    def refresh(self, full: bool = False) -> bool:
+        """Reload the catalogue; True if anything changed."""
+        with self._lock:
+            full = full or time.time() - self.last_full >= FACET_FULL_REFRESH_SECONDS
+            brands = self._load_brands(full)
+            listers = self._load_listers()
+            if full:
+                self.last_full = time.time()
+
+            if brands == self.brands and listers == self.listers and self.version:
+                return False
+
+            self.brands = brands
+            self.listers = listers
+            self.version += 1
+            self._responses = {}
+            logger.info(
+                f"Facet catalogue v{self.version}: {len(brands)} brands, "
+                f"{len(listers)} countries with shops"
+            )
+            return True
+
+    def _run(self):
+        while True:
+            time.sleep(FACET_REFRESH_SECONDS)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Facet catalogue refresh failed: {e}")
+
+    def ensure_loaded(self):
+        """Build on first use and start the background refresh."""
+        if self.version:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="facet-refresh", daemon=True
+                )
+                self._thread.start()
+            if not self.version:
+                self.refresh(full=True)
+
+    def response(
+        self, key: Hashable, build: Callable[["FacetCatalogue"], bytes]
+    ) -> Tuple[bytes, str]:
+        """Serialized response and ETag for key, built once per version."""
+        self.ensure_loaded()
+        responses = self._responses
+        cached = responses.get(key)
+        if cached is None:
+            body = build(self)
+            cached = responses[key] = (body, make_etag(body))
+        return cached
+
+
+facet_catalogue = FacetCatalogue()
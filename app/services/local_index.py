@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+from qdrant_client.models import ScoredPoint
+
+from services.vector_store import export_points
+
+logger = logging.getLogger(__name__)
+
+PAYLOAD_FIELDS = ["label", "generalized_gender", "product_id", "image_id"]
+
+
+def _partition(label, gender) -> str:
+    return f"{label}|{gender}"
+
+
+class LocalIndex:
+    """
+    In-process copy of tbnetv1_vectors for serving searches without Qdrant.
+
+    Vectors are stored normalized as float16, grouped by (label,
+    generalized_gender) so a search only scans the partitions its filter
+    allows. Everything is memory-mapped, so workers on the host share pages.
+
+    Layout of the index directory:
+        index.json       {"partitions": {"label|gender": [start, end]}}
+        vectors.npy      float16 (N, D), rows grouped by partition
+        ids.npy, product_ids.npy, image_ids.npy   bytes, aligned with vectors
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "index.json")) as f:
+            self.partitions = json.load(f)["partitions"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.product_ids = np.load(
+            os.path.join(path, "product_ids.npy"), mmap_mode="r"
+        )
+        self.image_ids = np.load(os.path.join(path, "image_ids.npy"), mmap_mode="r")
+
+    @classmethod
+    def open(cls, path: Optional[str]) -> Optional["LocalIndex"]:
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Local index at {path} unavailable: {e}")
+            return None
+
+    def search(
+        self, vector, label: str, genders: list[str], limit: int
+    ) -> list[ScoredPoint]:
+        """Exact cosine search over the partitions matching label/genders."""
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        query /= np.linalg.norm(query) or 1
+
+        rows, scores = [], []
+        for gender in dict.fromkeys(genders):
+            span = self.partitions.get(_partition(label, gender))
+            if span is None:
+                continue
+            start, end = span
+            rows.append(np.arange(start, end))
+            scores.append(self.vectors[start:end] @ query)
+
+        if not rows:
+            return []
+
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        top_rows = rows[top]
+        # one gather; hits carry float32 rows the rerank stacks as they are
+        vectors = self.vectors[top_rows].astype(np.float32)
+
+        # model_construct: skip validation, which would turn rows into lists
+        return [
+            ScoredPoint.model_construct(
+                id=self.ids[row].decode(),
+                version=0,
+                score=float(scores[i]),
+                payload={
+                    "product_id": self.product_ids[row].decode(),
+                    "image_id": self.image_ids[row].decode(),
+                },
+                vector=vector,
+            )
+            for i, row, vector in zip(top, top_rows, vectors)
+        ]
+
+
+def build_local_index(client, collection: str, out_dir: str, batch: int = 1000):
+    """Export a Qdrant collection into a LocalIndex directory."""
+    os.makedirs(out_dir, exist_ok=True)
+
+    tmp_path = os.path.join(out_dir, "vectors.tmp.npy")
+    ids, payload = export_points(
+        client, collection, tmp_path, PAYLOAD_FIELDS, normalize=True, batch=batch
+    )
+    if not ids:
+        print(f"Collection {collection} is empty, nothing exported")
+        return
+
+    # Group rows by partition
+    parts = np.array(
+        [
+            _partition(label, gender)
+            for label, gender in zip(payload["label"], payload["generalized_gender"])
+        ]
+    )
+    order = np.argsort(parts, kind="stable")
+    raw = np.load(tmp_path, mmap_mode="r")
+    vectors = np.lib.format.open_memmap(
+        os.path.join(out_dir, "vectors.npy"),
+        mode="w+",
+        dtype=np.float16,
+        shape=raw.shape,
+    )
+    for start in range(0, len(order), 100_000):
+        chunk = order[start : start + 100_000]
+        vectors[start : start + len(chunk)] = raw[chunk]
+    vectors.flush()
+    del raw
+    os.remove(tmp_path)
+
+    def column(field: str) -> np.ndarray:
+        values = payload[field]
+        return np.array([("" if v is None else str(v)).encode() for v in values])
+
+    np.save(os.path.join(out_dir, "ids.npy"), np.array(ids)[order])
+    np.save(os.path.join(out_dir, "product_ids.npy"), column("product_id")[order])
+    np.save(os.path.join(out_dir, "image_ids.npy"), column("image_id")[order])
+
+    names, starts, counts = np.unique(
+        parts[order], return_index=True, return_counts=True
+    )
+    partitions = {
+        str(name): [int(s), int(s + c)] for name, s, c in zip(names, starts, counts)
+    }
+    with open(os.path.join(out_dir, "index.json"), "w") as f:
+        json.dump({"collection": collection, "partitions": partitions}, f)
+
+
+def check_recall(client, collection: str, index: LocalIndex, queries: int, k: int):
+    """recall@k of the local index against Qdrant's exact (brute force) search."""
+    from qdrant_client.models import SearchParams
+    from services.product_search import _gender_match, _search_filter
+
+    rng = np.random.default_rng(0)
+    recalls = []
+    for _ in range(queries):
+        row = int(rng.integers(len(index.ids)))
+        label, gender = next(
+            p.split("|", 1)
+            for p, (start, end) in index.partitions.items()
+            if start <= row < end
+        )
+        vector = index.vectors[row].astype(np.float32)
+        vector += rng.normal(scale=0.01, size=vector.shape).astype(np.float32)
+
+        exact = client.search(
+            collection_name=collection,
+            query_vector=vector.tolist(),
+            limit=k,
+            query_filter=_search_filter(label, gender),
+            search_params=SearchParams(exact=True),
+        )
+        local = index.search(vector, label, _gender_match(gender), k)
+
+        expected = {str(h.id) for h in exact}
+        if expected:
+            recalls.append(len(expected & {h.id for h in local}) / len(expected))
+
+    print(f"recall@{k} over {len(recalls)} queries: {np.mean(recalls):.4f}")
+
+
+if __name__ == "__main__":
+    # python -m services.local_index build <dir>
+    # python -m services.local_index recall <dir> [queries] [k]
+    from services.product_search import qdrant
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "build":
+        build_local_index(qdrant, "tbnetv1_vectors", path)
+    elif command == "recall":
+        queries = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+        k = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+        check_recall(qdrant, "tbnetv1_vectors", LocalIndex(path), queries, k)
+    else:
+        raise SystemExit(f"Unknown command {command}")
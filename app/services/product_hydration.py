@@ -0,0 +1,152 @@
+import logging
+import os
+from typing import Any, Dict, Iterable, List
+
+from cachetools import TTLCache
+
+from services.cloud import postgrest_in, postgrest_select
+from services.currency import currency_rates
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SELECT = (
+    "id,brand,"
+    "product_images(url,s3_key,sort),"
+    "v_product_listings:shop_listings!inner("
+    "*,variant(size),feeds(id,name,domain,bf_logo))"
+)
+
+# product id -> {currency: grouped product}
+_product_cache = TTLCache(
+    maxsize=int(os.getenv("PRODUCT_CACHE_SIZE", "20000")),
+    ttl=int(os.getenv("PRODUCT_CACHE_TTL", "600")),
+)
+
+
+async def fetch_products(product_ids: List[str]) -> List[Dict[str, Any]]:
+    if not product_ids:
+        return []
+
+    return await postgrest_select(
+        "products",
+        {
+            "select": PRODUCT_SELECT,
+            "id": postgrest_in(product_ids),
+            "product_images.order": "sort.asc",
+        },
+    )
+
+
+def group_product(p: Dict[str, Any], currency: str = "DKK") -> Dict[str, Any]:
+    """
+    Convert one product row coming from Supabase into the shape expected by
+    the client (without the per-search fields such as confidence and index).
+    """
+    imgs = p.get("product_images") or []
+    # images come ordered from the query; only sort when they are not
+    if any(a.get("sort", 0) > b.get("sort", 0) for a, b in zip(imgs, imgs[1:])):
+        imgs = sorted(imgs, key=lambda i: i.get("sort", 0))
+    img_urls = [
+        f"https://trendbook.s3.eu-west-1.amazonaws.com/{img['s3_key']}"
+        for img in imgs
+        if img.get("s3_key")
+    ]
+
+    # ---------- listings ----------
+    listings = p.get("v_product_listings", [])
+    feed_listings: Dict[str, Dict[str, Any]] = {}
+
+    # Track the cheapest *in-stock* price while we build the feeds
+    cheapest_price: float | None = None
+
+    # skip out-of-stock or price-less variants everywhere
+    in_stock = [
+        lst for lst in listings if lst.get("in_stock") and lst.get("price") is not None
+    ]
+
+    # convert every price and compare price of the product in one pass
+    with_compare = [lst for lst in in_stock if lst["compare_price"] is not None]
+    converted = currency_rates.convert_rounded(
+        [lst["price"] for lst in in_stock]
+        + [lst["compare_price"] for lst in with_compare],
+        [lst["currency"] for lst in in_stock]
+        + [lst["currency"] for lst in with_compare],
+        currency,
+    )
+    compare_prices = iter(converted[len(in_stock) :])
+
+    for lst, converted_price in zip(in_stock, converted):
+        compare_price = (
+            next(compare_prices) if lst["compare_price"] is not None else None
+        )
+        feed_name = lst["feeds"]["name"]
+
+        # update cheapest price once, not twice
+        if cheapest_price is None or converted_price < cheapest_price:
+            cheapest_price = converted_price
+
+        if feed_name not in feed_listings:
+            feed_listings[feed_name] = {
+                **lst["feeds"],
+                "price_original": converted_price,  # for display
+                "price": converted_price,  # effective selling price
+                "compare_price": compare_price,
+                "original_currency": lst["currency"],
+                "currency": currency,
+                "link": lst["affiliate_url"],
+                "sizes": [],
+            }
+
+        # add the size only if we actually have one
+        size = lst.get("variant", {}).get("size")
+        if size:
+            feed_listings[feed_name]["sizes"].append(size)
+
+    return {
+        "id": p["id"],
+        "brand": p["brand"],
+        "from_price": cheapest_price,  # now only in-stock / converted once
+        "currency": currency,
+        "listings": list(feed_listings.values()),
+        "images": img_urls,
+    }
+
+
+async def hydrate_products(
+    product_ids: List[str], currency: str = "DKK"
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Grouped products by id. Cached products are returned as is; the missing
+    ones are fetched in one call, grouped and cached. Ids that don't exist
+    (or have no listing) are left out. Callers must copy before mutating.
+    """
+    products: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+
+    for pid in product_ids:
+        grouped = _product_cache.get(pid, {}).get(currency)
+        if grouped is not None:
+            products[pid] = grouped
+        else:
+            missing.append(pid)
+
+    for p in await fetch_products(missing):
+        grouped = group_product(p, currency)
+        products[p["id"]] = grouped
+        entry = _product_cache.get(p["id"])
+        if entry is None:
+            _product_cache[p["id"]] = {currency: grouped}
+        else:
+            entry[currency] = grouped
+
+    return products
+
+
+def invalidate_products(product_ids: Iterable[str]) -> None:
+    """Drop cached products, e.g. after their listings or images changed."""
+    for pid in product_ids:
+        _product_cache.pop(pid, None)
+
+
+def clear_product_cache() -> None:
+    _product_cache.clear()
@@ -1,20 +1,35 @@
+import asyncio
 import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from functools import partial
+from multiprocessing.shared_memory import SharedMemory
 from typing import Optional
 
 import numpy as np
 
-from services.reranking import re_ranking
+from services.local_index import LocalIndex
+from services.reranking import rerank_shared, rerank_vectors
+from services.search_payload import PAYLOAD_CURRENCIES
+from services.currency import currency_rates
+from services.vector_cache import vector_cache
+from services.vector_store import VectorStore
 from .cloud import postgresql
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import (
     Filter,
     FieldCondition,
     MatchValue,
     MatchAny,
+    Range,
     SearchRequest,
 )
-from sklearn.metrics.pairwise import cosine_distances
+
+logger = logging.getLogger(__name__)
 
 qdrant = QdrantClient(
     host="54.228.147.115",
@@ -24,61 +39,209 @@ qdrant = QdrantClient(
     timeout=10,
 )
 
+async_qdrant = AsyncQdrantClient(
+    host="54.228.147.115",
+    port=6333,
+    grpc_port=6334,
+    prefer_grpc=True,
+    timeout=10,
+)
+
+# Local copy of the gallery vectors; when present Qdrant only returns ids
+vector_store = VectorStore.open(os.getenv("VECTOR_STORE_DIR"))
+
+# In-process index: "primary" serves every search from it, "fallback" only
+# when Qdrant errors or takes longer than QDRANT_LATENCY_BUDGET seconds
+local_index = LocalIndex.open(os.getenv("LOCAL_INDEX_DIR"))
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "fallback")
+QDRANT_LATENCY_BUDGET = float(os.getenv("QDRANT_LATENCY_BUDGET", "1.0"))
+
+# Rerank offload: 0 workers keeps it in a thread of the API process
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", "0"))
+# Max reranks queued or running at once; further searches wait their turn
+RERANK_QUEUE_SIZE = int(
+    os.getenv("RERANK_QUEUE_SIZE", str(max(RERANK_WORKERS, 1) * 4))
+)
+# Max searches waiting for a slot; past that searches fail fast with
+# RerankBusy (503) instead of piling up behind the queue
+RERANK_MAX_WAITING = int(os.getenv("RERANK_MAX_WAITING", str(RERANK_QUEUE_SIZE * 4)))
+
+_rerank_pool: Optional[ProcessPoolExecutor] = None
+_rerank_slots = asyncio.Semaphore(RERANK_QUEUE_SIZE)
+_rerank_waiting = 0
+_rerank_counts = {"reranks": 0, "rejected": 0}
+
+
+class RerankBusy(Exception):
+    """Every rerank slot is taken and RERANK_MAX_WAITING searches wait."""
+
+
+def _get_rerank_pool() -> ProcessPoolExecutor:
+    global _rerank_pool
+    if _rerank_pool is None:
+        _rerank_pool = ProcessPoolExecutor(
+            max_workers=RERANK_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _rerank_pool
+
+
+# Only the payload fields results are built from
+HIT_PAYLOAD = ["product_id", "image_id"]
+
+
+@dataclass(frozen=True)
+class SearchSettings:
+    limit: int = 200  # ANN candidates fetched from Qdrant
+    k1: int = 20
+    k2: int = 6
+    lambda_value: float = 0.3
+    adaptive: bool = False
+    skip_gap: float = 0.05  # top-1/top-2 ANN score gap that skips the rerank
+    depth_margin: float = 0.15  # rerank only hits this close to the best score
+    min_depth: int = 50
+
+
+DEFAULT_SETTINGS = SearchSettings()
+
+# Per-label overrides, e.g. SEARCH_LABEL_SETTINGS='{"shoes": {"limit": 100}}'
+LABEL_SETTINGS: dict = json.loads(os.getenv("SEARCH_LABEL_SETTINGS", "{}"))
+
+
+def search_settings(label: str, **overrides) -> SearchSettings:
+    """Defaults, then the label's overrides, then per-request values (None = unset)."""
+    values = {
+        **LABEL_SETTINGS.get(label, {}),
+        **{k: v for k, v in overrides.items() if v is not None},
+    }
+    return replace(DEFAULT_SETTINGS, **values)
+
+
+@dataclass(frozen=True)
+class SearchFilters:
+    """
+    Facet selections applied inside the Qdrant query, on the payload fields
+    set by services.search_payload. Prices are in `currency`.
+    """
+
+    brands: tuple[str, ...] = ()
+    feed_ids: tuple[str, ...] = ()
+    currency: str = "DKK"
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.brands
+            or self.feed_ids
+            or self.min_price is not None
+            or self.max_price is not None
+        )
+
+    def conditions(self) -> list[FieldCondition]:
+        conditions = []
+        if self.brands:
+            conditions.append(
+                FieldCondition(key="brand", match=MatchAny(any=list(self.brands)))
+            )
+        if self.feed_ids:
+            conditions.append(
+                FieldCondition(key="feed_ids", match=MatchAny(any=list(self.feed_ids)))
+            )
+        if self.min_price is not None or self.max_price is not None:
+            currency, bounds = self.currency, [self.min_price, self.max_price]
+            if currency not in PAYLOAD_CURRENCIES:
+                # no stored price in this currency, filter on the first one
+                known = [b for b in bounds if b is not None]
+                converted = iter(
+                    currency_rates.convert(
+                        known, [currency] * len(known), PAYLOAD_CURRENCIES[0]
+                    ).tolist()
+                )
+                currency = PAYLOAD_CURRENCIES[0]
+                bounds = [next(converted) if b is not None else None for b in bounds]
+            conditions.append(
+                FieldCondition(
+                    key=f"min_price.{currency}",
+                    range=Range(gte=bounds[0], lte=bounds[1]),
+                )
+            )
+        return conditions
 
-def vectorSearch(vector: list[float], label: str, gender: str) -> list[dict]:
 
+def _cache_variant(settings: SearchSettings, filters: Optional[SearchFilters]):
+    return (settings, filters) if filters else settings
+
+
+def _gender_match(gender: str) -> list[str]:
     gender_match = ["unisex"]
     if gender is not None and gender != "all":
         gender_match.append(gender)
+    return gender_match
+
 
-    print(gender_match)
+def _search_filter(
+    label: str, gender: str, filters: Optional[SearchFilters] = None
+) -> Filter:
+    gender_match = _gender_match(gender)
 
-    search_filter = Filter(
+    return Filter(
         must=[
             FieldCondition(key="label", match=MatchValue(value=label)),
             FieldCondition(
                 key="generalized_gender",
                 match=MatchAny(any=gender_match),
             ),
+            *(filters.conditions() if filters else []),
         ]
     )
 
-    hits = qdrant.search(
-        collection_name="tbnetv1_vectors",
-        query_vector=vector,
-        limit=200,  # More candidates = better re-ranking
-        query_filter=search_filter,
-        with_vectors=True,
-        with_payload=True,
-    )
 
-    if not hits:
-        return []
+def _rerank_depth(hits: list, settings: SearchSettings) -> int:
+    """
+    How many of the top hits to rerank. In adaptive mode a clear ANN winner
+    skips the rerank (0), otherwise only hits scoring within depth_margin of
+    the best are reranked (at least min_depth). Fewer than two hits are never
+    reranked.
+    """
+    if len(hits) < 2:
+        return 0
+    if not settings.adaptive:
+        return len(hits)
 
-    gallery_vecs = np.array([h.vector for h in hits], dtype=np.float32)
-    query_vec = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    best = hits[0].score
+    if best - hits[1].score >= settings.skip_gap:
+        return 0
+
+    within = sum(1 for h in hits if h.score >= best - settings.depth_margin)
+    depth = min(len(hits), max(settings.min_depth, within))
+    return depth if depth >= 2 else 0
 
-    q_g = cosine_distances(query_vec, gallery_vecs)
-    q_q = np.zeros((1, 1), dtype=np.float32)
-    g_g = cosine_distances(gallery_vecs, gallery_vecs)
 
-    ng = len(hits)
-    k1_eff = min(20, ng - 1)
-    k2_eff = min(6, k1_eff)
+def _format_hits(hits: list, reranked: Optional[np.ndarray]) -> list[dict]:
+    """
+    Results in reranked order. Hits past the reranked head keep their ANN
+    order with the cosine distance as distance, offset by 1 when a head was
+    reranked so they always sort after it (reranked distances are <= 1).
+    """
+    ranked = []
+    head = 0
+    if reranked is not None:
+        head = reranked.shape[1]
+        ranked = [(hits[i], float(reranked[0, i])) for i in np.argsort(reranked[0])]
 
-    reranked = re_ranking(q_g, q_q, g_g, k1=k1_eff, k2=k2_eff, lambda_value=0.3)
-    order = np.argsort(reranked[0])
+    offset = 1 if head else 0
+    ranked += [(h, offset + 1 - h.score) for h in hits[head:]]
 
     results = []
-    for i, idx in enumerate(order):
-        h = hits[idx]
+    for i, (h, distance) in enumerate(ranked):
         results.append(
             {
                 "rank": i + 1,
                 "id": h.id,
                 "product_id": h.payload.get("product_id"),
                 "image_id": h.payload.get("image_id"),
-                "distance": float(reranked[0, idx]),
+                "distance": distance,
                 "ann_score": h.score,
             }
         )
@@ -86,6 +249,302 @@ def vectorSearch(vector: list[float], label: str, gender: str) -> list[dict]:
     return results
 
 
+async def _gallery_vectors(hits: list) -> np.ndarray:
+    """
+    Gallery matrix for the hits: from the vectors the hits carry, else from
+    the local vector store (fetching only ids it is missing).
+    """
+    if vector_store is None or hits[0].vector is not None:
+        return np.array([h.vector for h in hits], dtype=np.float32)
+
+    gallery, missing = vector_store.lookup([h.id for h in hits])
+    if missing:
+        points = await async_qdrant.retrieve(
+            collection_name="tbnetv1_vectors",
+            ids=[hits[i].id for i in missing],
+            with_vectors=True,
+            with_payload=False,
+        )
+        by_id = {p.id: p.vector for p in points}
+        for i in missing:
+            gallery[i] = by_id[hits[i].id]
+
+    return gallery
+
+
+def _rerank_matrix(
+    vector: list[float], gallery_vecs: np.ndarray, settings: SearchSettings
+) -> np.ndarray:
+    query_vec = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    return rerank_vectors(
+        query_vec,
+        gallery_vecs,
+        k1=settings.k1,
+        k2=settings.k2,
+        lambda_value=settings.lambda_value,
+    )
+
+
+def _rerank_hits(
+    vector: list[float],
+    hits: list,
+    settings: SearchSettings = DEFAULT_SETTINGS,
+) -> list[dict]:
+    if not hits:
+        return []
+
+    depth = _rerank_depth(hits, settings)
+    if depth == 0:
+        return _format_hits(hits, None)
+
+    gallery_vecs = np.array([h.vector for h in hits[:depth]], dtype=np.float32)
+    return _format_hits(hits, _rerank_matrix(vector, gallery_vecs, settings))
+
+
+async def _acquire_rerank_slot():
+    global _rerank_waiting
+    if _rerank_slots.locked() and _rerank_waiting >= RERANK_MAX_WAITING:
+        _rerank_counts["rejected"] += 1
+        raise RerankBusy(f"{_rerank_waiting} searches waiting for a rerank slot")
+
+    _rerank_waiting += 1
+    try:
+        await _rerank_slots.acquire()
+    finally:
+        _rerank_waiting -= 1
+    _rerank_counts["reranks"] += 1
+
+
+def rerank_stats() -> dict:
+    return {
+        **_rerank_counts,
+        "waiting": _rerank_waiting,
+        "slots": RERANK_QUEUE_SIZE,
+        "max_waiting": RERANK_MAX_WAITING,
+    }
+
+
+async def _rerank_hits_async(
+    vector: list[float], hits: list, settings: SearchSettings
+) -> list[dict]:
+    """
+    Rerank off the event loop. With RERANK_WORKERS > 0 the vectors are written
+    to shared memory and the numpy work runs in the process pool. Raises
+    RerankBusy when the rerank queue is full.
+    """
+    if not hits:
+        return []
+
+    depth = _rerank_depth(hits, settings)
+    if depth == 0:
+        return _format_hits(hits, None)
+
+    gallery = await _gallery_vectors(hits[:depth])
+
+    await _acquire_rerank_slot()
+    try:
+        if RERANK_WORKERS <= 0:
+            reranked = await asyncio.to_thread(
+                _rerank_matrix, vector, gallery, settings
+            )
+            return _format_hits(hits, reranked)
+
+        shape = (depth + 1, len(vector))
+        shm = SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+        try:
+            vecs = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            vecs[0] = vector
+            vecs[1:] = gallery
+            del vecs
+
+            reranked = await asyncio.get_running_loop().run_in_executor(
+                _get_rerank_pool(),
+                partial(
+                    rerank_shared,
+                    shm.name,
+                    shape,
+                    k1=settings.k1,
+                    k2=settings.k2,
+                    lambda_value=settings.lambda_value,
+                ),
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+    finally:
+        _rerank_slots.release()
+
+    return _format_hits(hits, reranked)
+
+
+async def _local_search(vector, label: str, gender: str, settings: SearchSettings):
+    return await asyncio.to_thread(
+        local_index.search, vector, label, _gender_match(gender), settings.limit
+    )
+
+
+async def _search_hits(
+    vector: list[float],
+    label: str,
+    gender: str,
+    settings: SearchSettings,
+    filters: Optional[SearchFilters] = None,
+) -> list:
+    """
+    ANN candidates from Qdrant, or from the local index (see LOCAL_INDEX_MODE).
+    The local index has no brand/shop/price payload, so filtered searches
+    always go to Qdrant.
+    """
+    use_local = local_index is not None and not filters
+    if use_local and LOCAL_INDEX_MODE == "primary":
+        return await _local_search(vector, label, gender, settings)
+
+    search = async_qdrant.search(
+        collection_name="tbnetv1_vectors",
+        query_vector=vector,
+        limit=settings.limit,
+        query_filter=_search_filter(label, gender, filters),
+        with_vectors=vector_store is None,
+        with_payload=HIT_PAYLOAD,
+    )
+    if not use_local:
+        return await search
+
+    try:
+        return await asyncio.wait_for(search, QDRANT_LATENCY_BUDGET)
+    except Exception as e:
+        logger.warning(f"Qdrant search failed or over budget, using local index: {e!r}")
+        return await _local_search(vector, label, gender, settings)
+
+
+async def _search_hits_batch(
+    queries: list[tuple[dict, SearchSettings]],
+    gender: str,
+    filters: Optional[SearchFilters] = None,
+) -> list[list]:
+    """Batched _search_hits: one Qdrant round trip for all (query, settings)."""
+
+    async def local():
+        return await asyncio.gather(
+            *(_local_search(q["embedding"], q["label"], gender, s) for q, s in queries)
+        )
+
+    use_local = local_index is not None and not filters
+    if use_local and LOCAL_INDEX_MODE == "primary":
+        return await local()
+
+    requests = [
+        SearchRequest(
+            vector=q["embedding"],
+            filter=_search_filter(q["label"], gender, filters),
+            limit=s.limit,
+            with_vector=vector_store is None,
+            with_payload=HIT_PAYLOAD,
+        )
+        for q, s in queries
+    ]
+    search = async_qdrant.search_batch(
+        collection_name="tbnetv1_vectors", requests=requests
+    )
+    if not use_local:
+        return await search
+
+    try:
+        return await asyncio.wait_for(search, QDRANT_LATENCY_BUDGET)
+    except Exception as e:
+        logger.warning(f"Qdrant batch failed or over budget, using local index: {e!r}")
+        return await local()
+
+
+def vectorSearch(
+    vector: list[float],
+    label: str,
+    gender: str,
+    filters: Optional[SearchFilters] = None,
+    **overrides,
+) -> list[dict]:
+    settings = search_settings(label, **overrides)
+    variant = _cache_variant(settings, filters)
+
+    cached = vector_cache.get(vector, label, gender, variant)
+    if cached is not None:
+        return cached
+
+    hits = qdrant.search(
+        collection_name="tbnetv1_vectors",
+        query_vector=vector,
+        limit=settings.limit,  # More candidates = better re-ranking
+        query_filter=_search_filter(label, gender, filters),
+        with_vectors=True,
+        with_payload=True,
+    )
+
+    results = _rerank_hits(vector, hits, settings)
+    vector_cache.put(vector, label, gender, results, variant)
+    return results
+
+
+async def vectorSearchAsync(
+    vector: list[float],
+    label: str,
+    gender: str,
+    filters: Optional[SearchFilters] = None,
+    **overrides,
+) -> list[dict]:
+    """
+    Same as vectorSearch, but awaits Qdrant and runs the rerank off the
+    event loop (thread or process pool, see RERANK_WORKERS).
+    """
+    settings = search_settings(label, **overrides)
+    variant = _cache_variant(settings, filters)
+
+    cached = vector_cache.get(vector, label, gender, variant)
+    if cached is not None:
+        return cached
+
+    hits = await _search_hits(vector, label, gender, settings, filters)
+
+    results = await _rerank_hits_async(vector, hits, settings)
+    vector_cache.put(vector, label, gender, results, variant)
+    return results
+
+
+async def vectorSearchBatch(
+    queries: list[dict],
+    gender: str,
+    filters: Optional[SearchFilters] = None,
+    **overrides,
+) -> list[list[dict]]:
+    """
+    Run several searches (dicts with "embedding" and "label") in one Qdrant
+    round trip. Returns one reranked result list per query, in order.
+    """
+    settings = [search_settings(q["label"], **overrides) for q in queries]
+    results = [
+        vector_cache.get(q["embedding"], q["label"], gender, _cache_variant(s, filters))
+        for q, s in zip(queries, settings)
+    ]
+    misses = [(q, s) for q, s, r in zip(queries, settings, results) if r is None]
+    if not misses:
+        return results
+
+    batch_hits = await _search_hits_batch(misses, gender, filters)
+
+    searched = await asyncio.gather(
+        *(
+            _rerank_hits_async(q["embedding"], hits, s)
+            for (q, s), hits in zip(misses, batch_hits)
+        )
+    )
+    for (q, s), r in zip(misses, searched):
+        vector_cache.put(
+            q["embedding"], q["label"], gender, r, _cache_variant(s, filters)
+        )
+
+    searched = iter(searched)
+    return [r if r is not None else next(searched) for r in results]
+
+
 def vectorSearchDepreciated(vector: list, label: str) -> list:
     """
     Perform a vector similarity search on the TBNetV1 column.
@@ -1,6 +1,23 @@
+from multiprocessing.shared_memory import SharedMemory
+
 import numpy as np
 
 
+def _top_k(dist, k):
+    """Indices of the k smallest entries per row, ordered by distance."""
+    if k >= dist.shape[1]:
+        return np.argsort(dist, axis=1)
+    part = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(dist, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _neighbour_mask(rank, n):
+    mask = np.zeros((rank.shape[0], n), dtype=bool)
+    np.put_along_axis(mask, rank, True, axis=1)
+    return mask
+
+
 def re_ranking(q_g_dist, q_q_dist, g_g_dist, k1=20, k2=6, lambda_value=0.3):
     query_num = q_g_dist.shape[0]
     gallery_num = q_g_dist.shape[1]
@@ -18,54 +35,85 @@ def re_ranking(q_g_dist, q_q_dist, g_g_dist, k1=20, k2=6, lambda_value=0.3):
     original_dist /= np.max(original_dist, axis=0, keepdims=True)
     original_dist = original_dist.T
 
-    V = np.zeros_like(original_dist, dtype=np.float32)
-    initial_rank = np.argsort(original_dist, axis=1)
-
-    for i in range(all_num):
-        forward_k = initial_rank[i, : k1 + 1]
-        backward_k = initial_rank[forward_k, : k1 + 1]
-        fi = np.where(backward_k == i)[0]
-        k_reciprocal = forward_k[fi]
-        k_reciprocal_exp = k_reciprocal.copy()
-
-        for candidate in k_reciprocal:
-            c_forward = initial_rank[candidate, : int(np.round(k1 / 2)) + 1]
-            c_backward = initial_rank[c_forward, : int(np.round(k1 / 2)) + 1]
-            fi_candidate = np.where(c_backward == candidate)[0]
-            c_reciprocal = c_forward[fi_candidate]
-            if len(np.intersect1d(c_reciprocal, k_reciprocal)) > 2 / 3 * len(
-                c_reciprocal
-            ):
-                k_reciprocal_exp = np.append(k_reciprocal_exp, c_reciprocal)
-
-        k_reciprocal_exp = np.unique(k_reciprocal_exp)
-        weight = np.exp(-original_dist[i, k_reciprocal_exp])
-        V[i, k_reciprocal_exp] = weight / np.sum(weight)
-
-    if k2 != 1:
-        V_qe = np.zeros_like(V, dtype=np.float32)
-        for i in range(all_num):
-            V_qe[i, :] = np.mean(V[initial_rank[i, :k2], :], axis=0)
-        V = V_qe
-        del V_qe
-
-    invIndex = []
-    for i in range(query_num, all_num):  # Only gallery columns
-        invIndex.append(np.where(V[:, i] != 0)[0])
+    k_half = int(np.round(k1 / 2)) + 1
+    initial_rank = _top_k(original_dist, k1 + 1)
+
+    # k-reciprocal neighbours: j is in i's top k1+1 and i is in j's top k1+1
+    forward = _neighbour_mask(initial_rank, all_num)
+    k_reciprocal = forward & forward.T
 
+    # Same for k1/2, used to expand each reciprocal set
+    forward_half = _neighbour_mask(initial_rank[:, :k_half], all_num)
+    half_reciprocal = forward_half & forward_half.T
+
+    # overlap[i, c] = |R_half(c) ∩ R(i)|
+    # (float32 matmuls are exact for these small counts and go through BLAS)
+    half_f = half_reciprocal.astype(np.float32)
+    overlap = k_reciprocal.astype(np.float32) @ half_f.T
+    half_size = half_f.sum(axis=1)
+    expand = k_reciprocal & (overlap > 2 / 3 * half_size[None, :])
+    k_reciprocal_exp = k_reciprocal | ((expand.astype(np.float32) @ half_f) > 0)
+
+    V = np.where(k_reciprocal_exp, np.exp(-original_dist), 0).astype(np.float32)
+    row_sum = V.sum(axis=1, keepdims=True)
+    np.divide(V, row_sum, out=V, where=row_sum > 0)
+
+    if k2 > 1:
+        qe = np.zeros_like(V, dtype=np.float32)
+        np.put_along_axis(qe, initial_rank[:, :k2], 1.0 / k2, axis=1)
+        V = qe @ V
+
+    # Only gallery columns take part in the Jaccard distance
+    V_gallery = V[:, query_num:]
     jaccard_dist = np.zeros((query_num, gallery_num), dtype=np.float32)
     for i in range(query_num):
-        temp_min = np.zeros((1, gallery_num), dtype=np.float32)
-        non_zero = np.where(V[i, :] != 0)[0]
-        for j in non_zero:
-            if j < query_num:
-                continue  # skip query columns
-            j_idx = j - query_num
-            temp_min[0, j_idx] += np.sum(np.minimum(V[i, j], V[invIndex[j_idx], j]))
-
+        temp_min = np.minimum(V_gallery[i], V_gallery).sum(axis=0)
         jaccard_dist[i] = 1 - temp_min / (2 - temp_min)
 
     final_dist = (1 - lambda_value) * jaccard_dist + lambda_value * original_dist[
         :query_num, query_num:
     ]
     return final_dist
+
+
+def gallery_distances(query_vec: np.ndarray, gallery_vecs: np.ndarray):
+    """
+    Cosine distances for re-ranking (query-gallery, query-query, gallery-gallery).
+    Vectors are normalized once and all blocks come from a single float32 matmul.
+    """
+    vecs = np.vstack([query_vec, gallery_vecs]).astype(np.float32, copy=False)
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    vecs /= np.where(norms == 0, 1, norms)
+
+    dist = 1 - vecs @ vecs.T
+    np.clip(dist, 0, 2, out=dist)
+    np.fill_diagonal(dist, 0)
+
+    nq = query_vec.shape[0]
+    return dist[:nq, nq:], dist[:nq, :nq], dist[nq:, nq:]
+
+
+def rerank_vectors(query_vec, gallery_vecs, k1=20, k2=6, lambda_value=0.3):
+    """Re-ranked query-gallery distances straight from the raw vectors."""
+    q_g, q_q, g_g = gallery_distances(query_vec, gallery_vecs)
+
+    ng = gallery_vecs.shape[0]
+    k1_eff = min(k1, ng - 1)
+    k2_eff = min(k2, k1_eff)
+
+    return re_ranking(q_g, q_q, g_g, k1=k1_eff, k2=k2_eff, lambda_value=lambda_value)
+
+
+def rerank_shared(shm_name: str, shape: tuple, nq: int = 1, **kwargs):
+    """
+    Process-pool entry point: the stacked [query; gallery] float32 matrix is
+    read from shared memory instead of being pickled across.
+    """
+    shm = SharedMemory(name=shm_name)
+    vecs = None
+    try:
+        vecs = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        return rerank_vectors(vecs[:nq], vecs[nq:], **kwargs)
+    finally:
+        del vecs
+        shm.close()
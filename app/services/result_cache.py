@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# "local": a TTLCache per worker process. "sqlite": one SQLite file shared by
+# every worker on the host (RESULT_CACHE_PATH), so a result computed by one
+# worker is a hit in all of them. Values are unpickled on read, so the file
+# must be in a directory only this user can write to.
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "local")
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), f"result-cache-{os.getuid()}", "cache.sqlite"),
+)
+# Seconds a SQLite call waits for another worker's write lock before the
+# cache is skipped (a read counts as a miss, a write is dropped)
+RESULT_CACHE_TIMEOUT = float(os.getenv("RESULT_CACHE_TIMEOUT", "0.1"))
+
+_MISSING = object()
+
+
+class ResultCache:
+    """
+    Dict-like cache of picklable values with a TTL. Subclasses implement
+    _get/_set/_delete/_clear and _usage; hits and misses are counted here.
+    Async code uses aget/aset, which keep blocking backends off the event
+    loop.
+    """
+
+    backend = ""
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self._get(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    async def aget(self, key, default=None):
+        return self.get(key, default)
+
+    async def aset(self, key, value):
+        self._set(key, value)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._set(key, value)
+
+    def __contains__(self, key) -> bool:
+        return self._get(key) is not _MISSING
+
+    def pop(self, key, default=None):
+        value = self._get(key)
+        self._delete(key)
+        return default if value is _MISSING else value
+
+    def clear(self):
+        self._clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            **self._usage(),
+            "hits": self.hits,  # this worker only
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class LocalResultCache(ResultCache):
+    """In-process TTLCache, bounded by entry count."""
+
+    backend = "local"
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        super().__init__(name, ttl)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _get(self, key):
+        return self._cache.get(key, _MISSING)
+
+    def _set(self, key, value):
+        self._cache[key] = value
+
+    def _delete(self, key):
+        self._cache.pop(key, None)
+
+    def _clear(self):
+        self._cache.clear()
+
+    def _usage(self) -> dict:
+        return {"entries": len(self._cache), "maxsize": self._cache.maxsize}
+
+
+class SqliteResultCache(ResultCache):
+    """
+    Cache in a table of a SQLite file shared by the workers of a host.
+
+    Values are pickled. Expired rows are skipped on read and purged on write;
+    when the table grows past max_bytes the entries expiring first (the
+    oldest, as all entries share the TTL) are evicted. Reads never write, so
+    they don't contend for the database lock. aget/aset run in a thread.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        max_bytes: int,
+        ttl: float,
+        timeout: float = RESULT_CACHE_TIMEOUT,
+    ):
+        super().__init__(name, ttl)
+        _check_private_dir(os.path.dirname(os.path.abspath(path)))
+        self.path = path
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.table = f"cache_{name}"
+        self._local = threading.local()
+
+        with self._conn() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL)"
+            )
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_expires "
+                f"ON {self.table} (expires)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread (sync endpoints run in a thread pool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    async def aget(self, key, default=None):
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key, value):
+        await asyncio.to_thread(self._set, key, value)
+
+    def _get(self, key):
+        try:
+            row = (
+                self._conn()
+                .execute(
+                    f"SELECT value FROM {self.table} WHERE key = ? AND expires > ?",
+                    (str(key), time.time()),
+                )
+                .fetchone()
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} read failed: {e}")
+            return _MISSING
+        return _MISSING if row is None else pickle.loads(row[0])
+
+    def _set(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} VALUES (?, ?, ?, ?)",
+                    (str(key), blob, len(blob), now + self.ttl),
+                )
+                conn.execute(f"DELETE FROM {self.table} WHERE expires <= ?", (now,))
+                (used,) = conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM {self.table}"
+                ).fetchone()
+                if used > self.max_bytes:
+                    self._evict(conn, used - self.max_bytes)
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} write failed: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, excess: int):
+        freed = 0
+        doomed = []
+        for key, size in conn.execute(
+            f"SELECT key, size FROM {self.table} ORDER BY expires"
+        ):
+            if freed >= excess:
+                break
+            doomed.append((key,))
+            freed += size
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", doomed)
+
+    def _delete(self, key):
+        try:
+            self._conn().execute(
+                f"DELETE FROM {self.table} WHERE key = ?", (str(key),)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"Cache {self.name} delete failed: {e}")
+
+    def _clear(self):
+        self._conn().execute(f"DELETE FROM {self.table}")
+
+    def _usage(self) -> dict:
+        entries, used = (
+            self._conn()
+            .execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table} "
+                "WHERE expires > ?",
+                (time.time(),),
+            )
+            .fetchone()
+        )
+        return {"entries": entries, "bytes": used, "max_bytes": self.max_bytes}
+
+
+def _check_private_dir(directory: str):
+    """
+    Create the cache directory for this user only, and refuse one that other
+    users can write to: whoever can write the file can make us unpickle
+    arbitrary objects.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.stat(directory)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise PermissionError(
+            f"Result cache directory {directory} must be owned by this user "
+            "and not writable by others"
+        )
+
+
+# name -> cache, for cache_stats()
+caches: dict[str, ResultCache] = {}
+
+
+def make_cache(
+    name: str,
+    maxsize: int,
+    ttl: float,
+    max_bytes: Optional[int] = None,
+    backend: Optional[str] = None,
+) -> ResultCache:
+    """
+    Cache for `name` on the configured backend. maxsize bounds the local
+    backend, max_bytes (RESULT_CACHE_<NAME>_BYTES, default 64 MB) the shared
+    one.
+    """
+    backend = backend or RESULT_CACHE_BACKEND
+    if backend == "sqlite":
+        max_bytes = max_bytes or int(
+            os.getenv(f"RESULT_CACHE_{name.upper()}_BYTES", str(64 * 1024 * 1024))
+        )
+        cache = SqliteResultCache(name, RESULT_CACHE_PATH, max_bytes, ttl)
+    elif backend == "local":
+        cache = LocalResultCache(name, maxsize, ttl)
+    else:
+        raise ValueError(f"Unknown RESULT_CACHE_BACKEND {backend}")
+
+    caches[name] = cache
+    return cache
+
+
+def cache_stats() -> dict[str, dict[str, Any]]:
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,139 @@
+import logging
+import os
+import sys
+from typing import Optional
+
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchAny,
+    PayloadSchemaType,
+    SetPayload,
+    SetPayloadOperation,
+)
+
+from services.currency import currency_rates
+
+logger = logging.getLogger(__name__)
+
+# Currencies the cheapest in-stock price is stored in, as min_price.<CUR>
+PAYLOAD_CURRENCIES = os.getenv(
+    "SEARCH_PRICE_CURRENCIES", "DKK,SEK,NOK,EUR,USD,GBP"
+).split(",")
+
+PRODUCT_FILTER_SELECT = "id,brand,shop_listings(price,currency,in_stock,feeds(id))"
+
+
+def product_payload(product: dict) -> dict:
+    """
+    Filterable fields of a product, set on every image point of it:
+        brand       str
+        feed_ids    ids of the feeds (shops) with it in stock, as strings
+        min_price   {currency: cheapest in-stock price}, rounded like from_price
+    """
+    listings = product.get("shop_listings") or []
+    in_stock = [
+        lst for lst in listings if lst.get("in_stock") and lst.get("price") is not None
+    ]
+
+    min_price = {}
+    if in_stock:
+        prices = [lst["price"] for lst in in_stock]
+        currencies = [lst["currency"] for lst in in_stock]
+        for currency in PAYLOAD_CURRENCIES:
+            min_price[currency] = min(
+                currency_rates.convert_rounded(prices, currencies, currency)
+            )
+
+    return {
+        "brand": product.get("brand"),
+        "feed_ids": sorted(
+            {str(lst["feeds"]["id"]) for lst in in_stock if lst.get("feeds")}
+        ),
+        "min_price": min_price,
+    }
+
+
+def ensure_payload_indexes(client, collection: str):
+    """Index the filter fields; Qdrant ignores indexes that already exist."""
+    client.create_payload_index(collection, "brand", PayloadSchemaType.KEYWORD)
+    client.create_payload_index(collection, "feed_ids", PayloadSchemaType.KEYWORD)
+    for currency in PAYLOAD_CURRENCIES:
+        client.create_payload_index(
+            collection, f"min_price.{currency}", PayloadSchemaType.FLOAT
+        )
+
+
+def enrich_payload(
+    client,
+    supabase,
+    collection: str,
+    product_ids: Optional[list[str]] = None,
+    batch: int = 256,
+):
+    """
+    Set brand, feed_ids and min_price on the points of a collection, for all
+    points or only those of `product_ids` (e.g. after their listings changed).
+    Products without in-stock listings get an empty min_price and so never
+    match a price filter.
+    """
+    ensure_payload_indexes(client, collection)
+
+    scroll_filter = None
+    if product_ids:
+        scroll_filter = Filter(
+            must=[FieldCondition(key="product_id", match=MatchAny(any=product_ids))]
+        )
+
+    done = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=scroll_filter,
+            limit=batch,
+            offset=offset,
+            with_vectors=False,
+            with_payload=["product_id"],
+        )
+
+        by_product: dict = {}
+        for p in points:
+            by_product.setdefault(p.payload.get("product_id"), []).append(p.id)
+        by_product.pop(None, None)
+
+        products = []
+        if by_product:
+            products = (
+                supabase.table("products")
+                .select(PRODUCT_FILTER_SELECT)
+                .in_("id", list(by_product))
+                .execute()
+            ).data or []
+
+        if products:
+            client.batch_update_points(
+                collection_name=collection,
+                update_operations=[
+                    SetPayloadOperation(
+                        set_payload=SetPayload(
+                            payload=product_payload(product),
+                            points=by_product[product["id"]],
+                        )
+                    )
+                    for product in products
+                ],
+            )
+
+        done += len(points)
+        print(f"Enriched {done} points")
+        if offset is None:
+            break
+
+
+if __name__ == "__main__":
+    # python -m services.search_payload [product_id ...]
+    from services.cloud import supabase
+    from services.product_search import qdrant
+
+    enrich_payload(qdrant, supabase, "tbnetv1_vectors", sys.argv[1:] or None)
@@ -1,33 +1,137 @@
 import logging
-from typing import List, Optional
-from cachetools import LRUCache
-import hashlib
-import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
 
-# Cache up to 100 queries per session (adjust as needed)
-vector_cache = LRUCache(maxsize=100)
+import numpy as np
 
+# Configure logging
+logger = logging.getLogger(__name__)
 
-def vector_key(
-    vector: list[float], label: str, gender: Optional[List[str]], detection_id: str
-) -> str:
-    """Create a unique cache key from search inputs including detection context."""
-    base = {
-        "vector": [round(v, 5) for v in vector],
-        "label": label,
-        "gender": gender or [],
-        "detection_id": detection_id,
-    }
-    return hashlib.sha256(json.dumps(base, sort_keys=True).encode()).hexdigest()
 
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
 
-def get_cached_result(key: str) -> Optional[list[dict]]:
-    return vector_cache.get(key)
 
+class SemanticVectorCache:
+    """
+    Reranked search results keyed by query embedding. A lookup hits when a
+    cached query with the same label/gender (and search settings, `variant`)
+    has cosine similarity at or above `threshold`, so near-identical crops of
+    the same item share one search.
 
-def cache_result(key: str, results: list[dict]) -> None:
-    vector_cache[key] = results
+    Cached queries are kept as one normalized matrix per bucket and
+    matched with a single matmul; the matrix is rebuilt lazily after inserts
+    and evictions. Entries expire `ttl` seconds after insertion, so results
+    follow catalogue and stock changes, and are evicted least recently used.
+    """
 
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        threshold: float = 0.99,
+        ttl: float = 300,
+        timer=time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
 
-# Configure logging
-logger = logging.getLogger(__name__)
+        # id -> (bucket, vec, results, expires)
+        self._entries: OrderedDict = OrderedDict()
+        # bucket -> (entry ids, matrix, expiry times), None if stale
+        self._buckets: dict = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _index(self, bucket):
+        index = self._buckets.get(bucket)
+        if index is None and bucket in self._buckets:
+            ids = [i for i, e in self._entries.items() if e[0] == bucket]
+            if not ids:
+                del self._buckets[bucket]
+                return None
+            index = (
+                ids,
+                np.stack([self._entries[i][1] for i in ids]),
+                np.array([self._entries[i][3] for i in ids]),
+            )
+            self._buckets[bucket] = index
+        return index
+
+    def _expire(self, bucket, ids: list, live: np.ndarray):
+        for i, alive in zip(ids, live):
+            if not alive:
+                del self._entries[i]
+        self._buckets[bucket] = None
+
+    def get(
+        self, vector, label: str, gender: Optional[str], variant: Hashable = None
+    ) -> Optional[list[dict]]:
+        bucket = (label, gender, variant)
+        query = _unit(vector)
+
+        with self._lock:
+            index = self._index(bucket)
+            if index is not None:
+                ids, matrix, expires = index
+                live = expires > self.timer()
+                if not live.all():
+                    self._expire(bucket, ids, live)
+                sims = np.where(live, matrix @ query, -np.inf)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        vector,
+        label: str,
+        gender: Optional[str],
+        results: list[dict],
+        variant: Hashable = None,
+    ):
+        bucket = (label, gender, variant)
+
+        with self._lock:
+            expires = self.timer() + self.ttl
+            self._entries[self._next_id] = (bucket, _unit(vector), results, expires)
+            self._next_id += 1
+            self._buckets[bucket] = None
+
+            while len(self._entries) > self.maxsize:
+                _, (old_bucket, *_) = self._entries.popitem(last=False)
+                self._buckets[old_bucket] = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+vector_cache = SemanticVectorCache(
+    maxsize=int(os.getenv("VECTOR_CACHE_SIZE", "1000")),
+    threshold=float(os.getenv("VECTOR_CACHE_THRESHOLD", "0.99")),
+    ttl=float(os.getenv("VECTOR_CACHE_TTL", "300")),
+)
@@ -0,0 +1,133 @@
+import logging
+import os
+import sys
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """
+    Read-only, memory-mapped copy of the Qdrant vectors keyed by point id.
+
+    Layout of the store directory:
+        vectors.npy  float16 (N, D), in export order
+        ids.npy      sorted point ids (bytes)
+        rows.npy     row in vectors.npy for each entry of ids.npy
+
+    The arrays are opened with mmap so every worker on the host shares the
+    same pages, and search only needs ids back from Qdrant.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+
+    @classmethod
+    def open(cls, path: Optional[str]) -> Optional["VectorStore"]:
+        if not path:
+            return None
+        try:
+            return cls(path)
+        except OSError as e:
+            logger.error(f"Vector store at {path} unavailable: {e}")
+            return None
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def lookup(self, point_ids: list) -> tuple[np.ndarray, list[int]]:
+        """
+        Gallery matrix (float32) for the given point ids, plus the positions
+        of ids that are not in the store (their rows are left at zero).
+        """
+        keys = np.array([str(i).encode() for i in point_ids], dtype=self.ids.dtype)
+        pos = np.searchsorted(self.ids, keys)
+        pos[pos >= len(self.ids)] = 0
+        found = self.ids[pos] == keys
+
+        gallery = np.zeros((len(point_ids), self.dim), dtype=np.float32)
+        gallery[found] = self.vectors[self.rows[pos[found]]]
+
+        return gallery, np.flatnonzero(~found).tolist()
+
+
+def export_points(
+    client,
+    collection: str,
+    path: str,
+    payload_fields: Optional[list[str]] = None,
+    normalize: bool = False,
+    batch: int = 1000,
+) -> tuple[list[bytes], dict[str, list]]:
+    """
+    Stream every vector of a Qdrant collection into a float16 .npy file at
+    path (unit length with normalize), without holding them in memory.
+
+    Returns the point ids (bytes) and, per payload field, the values, both
+    in row order. Nothing is written for an empty collection.
+    """
+    total = client.count(collection_name=collection, exact=True).count
+    vectors = None
+    ids = []
+    columns = {field: [] for field in payload_fields or []}
+
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            limit=batch,
+            offset=offset,
+            with_vectors=True,
+            with_payload=payload_fields or False,
+        )
+        for p in points:
+            if len(ids) >= total:
+                break  # points added while exporting; picked up next build
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=np.float16, shape=(total, len(p.vector))
+                )
+            v = np.asarray(p.vector, dtype=np.float32)
+            if normalize:
+                v /= np.linalg.norm(v) or 1
+            vectors[len(ids)] = v
+            ids.append(str(p.id).encode())
+            for field, values in columns.items():
+                values.append(p.payload.get(field))
+        print(f"Exported {len(ids)}/{total} vectors")
+        if offset is None:
+            break
+
+    if vectors is not None:
+        vectors.flush()
+    return ids, columns
+
+
+def build_vector_store(client, collection: str, out_dir: str, batch: int = 1000):
+    """Export every vector of a Qdrant collection into a VectorStore directory."""
+    os.makedirs(out_dir, exist_ok=True)
+
+    ids, _ = export_points(
+        client, collection, os.path.join(out_dir, "vectors.npy"), batch=batch
+    )
+    if not ids:
+        print(f"Collection {collection} is empty, nothing exported")
+        return
+
+    ids_arr = np.array(ids)
+    rows = np.argsort(ids_arr)
+    np.save(os.path.join(out_dir, "ids.npy"), ids_arr[rows])
+    np.save(os.path.join(out_dir, "rows.npy"), rows)
+
+
+if __name__ == "__main__":
+    # python -m services.vector_store <out_dir>
+    from services.product_search import qdrant
+
+    build_vector_store(qdrant, "tbnetv1_vectors", sys.argv[1])
@@ -0,0 +1,37 @@
+import os
+import sys
+import types
+from pathlib import Path
+
+# The app is run from app/ and imports its packages top-level
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+os.environ.setdefault("SUPABASE_URL", "http://supabase.invalid")
+os.environ.setdefault("SUPABASE_KEY", "test-key")
+
+
+class OfflineClient:
+    """
+    Stand-in for the tbpy_cloud clients so services import without network
+    access. Any call that reaches it fails; tests patch what they use.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        def offline(*args, **kwargs):
+            raise RuntimeError(f"{type(self).__name__}.{name} called in a test")
+
+        return offline
+
+
+try:
+    import tbpy_cloud  # noqa: F401
+except ImportError:
+    tbpy_cloud = types.ModuleType("tbpy_cloud")
+    tbpy_cloud.supabaseClient = OfflineClient
+    tbpy_cloud.PostgreSQL = OfflineClient
+    tbpy_cloud.S3Bucket = OfflineClient
+    sys.modules["tbpy_cloud"] = tbpy_cloud
@@ -0,0 +1,108 @@
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+
+import dependencies
+from services.auth import TokenVerifier
+
+SECRET = "test-secret-with-enough-bytes-for-hs256"
+
+
+def _token(key, alg="HS256", kid=None, **overrides):
+    now = int(time.time())
+    claims = {"sub": "u1", "aud": "authenticated", "iat": now, "exp": now + 3600}
+    claims.update(overrides)
+    claims = {k: v for k, v in claims.items() if v is not None}
+    return jwt.encode(claims, key, algorithm=alg, headers={"kid": kid} if kid else None)
+
+
+@pytest.fixture
+def hs256():
+    return TokenVerifier(secret=SECRET, jwks_url=None)
+
+
+@pytest.fixture
+def es256():
+    private = ec.generate_private_key(ec.SECP256R1())
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private.public_key()))
+    jwk.update({"kid": "k1", "alg": "ES256", "use": "sig"})
+
+    verifier = TokenVerifier(secret=None, jwks_url="http://jwks.invalid")
+    fetches = []
+
+    def fetch_data():
+        fetches.append(1)
+        return {"keys": [jwk]}
+
+    verifier.jwks.fetch_data = fetch_data
+    verifier.fetches = fetches
+    return verifier, private
+
+
+def test_hs256_token(hs256):
+    assert hs256.verify(_token(SECRET))["sub"] == "u1"
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        _token("some-other-secret-with-enough-bytes"),
+        _token(SECRET, exp=int(time.time()) - 10),
+        _token(SECRET, aud="anon"),
+        _token(SECRET, sub=None),
+    ],
+    ids=["bad signature", "expired", "audience", "no sub"],
+)
+def test_invalid_hs256_tokens(hs256, token):
+    with pytest.raises(jwt.InvalidTokenError):
+        hs256.verify(token)
+
+
+def test_claims_are_cached(hs256):
+    token = _token(SECRET)
+    claims = hs256.verify(token)
+
+    hs256.secret = "rotated"  # would fail verification if checked again
+    assert hs256.verify(token) is claims
+
+
+def test_expired_claims_leave_the_cache(hs256):
+    token = _token(SECRET, exp=int(time.time()) + 1)
+    hs256.verify(token)
+
+    time.sleep(1.5)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        hs256.verify(token)
+
+
+def test_es256_token_from_jwks(es256):
+    verifier, private = es256
+
+    assert verifier.verify(_token(private, "ES256", "k1"))["sub"] == "u1"
+    assert verifier.verify(_token(private, "ES256", "k1", sub="u2"))["sub"] == "u2"
+    assert len(verifier.fetches) == 1
+
+    other = ec.generate_private_key(ec.SECP256R1())
+    with pytest.raises(jwt.InvalidTokenError):
+        verifier.verify(_token(other, "ES256", "k1"))
+
+
+def test_undecidable_tokens_return_none(es256):
+    verifier, private = es256
+    # unknown key id, and HS256 without a configured secret
+    assert verifier.verify(_token(private, "ES256", "unknown")) is None
+    assert verifier.verify(_token(SECRET)) is None
+
+
+def test_user_id_falls_back_to_supabase_auth(monkeypatch):
+    monkeypatch.setattr(dependencies, "token_verifier", TokenVerifier(None, None))
+    monkeypatch.setattr(dependencies, "_remote_user_id", lambda token: "remote")
+    assert dependencies._token_user_id(_token(SECRET)) == "remote"
+
+    monkeypatch.setattr(
+        dependencies, "token_verifier", TokenVerifier(secret=SECRET, jwks_url=None)
+    )
+    assert dependencies._token_user_id(_token(SECRET)) == "u1"
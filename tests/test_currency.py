@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from currency_converter import CurrencyConverter, RateNotFoundError
+
+from services.currency import CurrencyRates
+
+
+@pytest.fixture(scope="module")
+def converter():
+    return CurrencyConverter()
+
+
+@pytest.fixture(scope="module")
+def rates(converter):
+    return CurrencyRates(converter)
+
+
+def test_matches_currency_converter(converter, rates):
+    rng = np.random.default_rng(0)
+    currencies = ["DKK", "SEK", "NOK", "EUR", "USD", "GBP", "CHF", "PLN"]
+    amounts = np.round(rng.uniform(0, 20000, size=400), 2).tolist()
+    sources = [currencies[i] for i in rng.integers(len(currencies), size=400)]
+
+    for target in currencies:
+        expected = [
+            round(converter.convert(amount, cur, target), 2)
+            for amount, cur in zip(amounts, sources)
+        ]
+        assert rates.convert_rounded(amounts, sources, target) == expected
+
+
+def test_every_currency_pair(converter, rates):
+    for cur in rates.currencies:
+        for new_cur in rates.currencies:
+            try:
+                expected = converter.convert(100, cur, new_cur)
+            except RateNotFoundError:
+                with pytest.raises(RateNotFoundError):
+                    rates.convert([100], [cur], new_cur)
+                continue
+            assert rates.convert([100], [cur], new_cur)[0] == expected
+
+
+def test_unknown_currency(rates):
+    with pytest.raises(ValueError):
+        rates.convert([1.0], ["XXX"], "DKK")
+    with pytest.raises(ValueError):
+        rates.convert([1.0], ["DKK"], "XXX")
+
+
+def test_empty(rates):
+    assert rates.convert_rounded([], [], "DKK") == []
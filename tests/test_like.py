@@ -0,0 +1,185 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.v1.like as like
+import main
+from dependencies import User, get_current_user
+
+
+class LikedTable:
+    """In-memory liked_products behind the PostgREST helpers like.py uses."""
+
+    def __init__(self):
+        self.rows = []
+        self.selects = 0
+
+    async def select(self, table, params):
+        assert table == "liked_products"
+        self.selects += 1
+        user = params["user"].removeprefix("eq.")
+        rows = sorted(
+            (r for r in self.rows if r["user"] == user), key=lambda r: r["product"]
+        )
+        offset = params.get("offset", 0)
+        return rows[offset : offset + params["limit"]]
+
+    async def insert(self, table, row):
+        if row in self.rows:
+            raise RuntimeError("duplicate key value violates unique constraint")
+        self.rows.append(row)
+        return [row]
+
+    async def delete(self, table, params):
+        user = params["user"].removeprefix("eq.")
+        product = params["product"].removeprefix("eq.")
+        deleted = [r for r in self.rows if r == {"user": user, "product": product}]
+        self.rows = [r for r in self.rows if r not in deleted]
+        return deleted
+
+    def liked(self, user):
+        return {r["product"] for r in self.rows if r["user"] == user}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = LikedTable()
+    monkeypatch.setattr(like, "postgrest_select", table.select)
+    monkeypatch.setattr(like, "postgrest_insert", table.insert)
+    monkeypatch.setattr(like, "postgrest_delete", table.delete)
+    like._liked_cache.clear()
+    return table
+
+
+@pytest.fixture
+def client(table):
+    main.app.dependency_overrides[get_current_user] = lambda: User(id="u1")
+    with TestClient(main.app) as c:
+        yield c
+    main.app.dependency_overrides.clear()
+
+
+def _liked_ids(client):
+    return client.portal.call(like.liked_product_ids, "u1")
+
+
+def test_liked_set_follows_like_and_unlike(client, table):
+    table.rows = [{"user": "u1", "product": "p1"}, {"user": "u2", "product": "p2"}]
+    assert _liked_ids(client) == {"p1"}
+
+    assert client.get("/api/v1/like-product", params={"product_id": "p3"}).json()[
+        "success"
+    ]
+    assert _liked_ids(client) == table.liked("u1") == {"p1", "p3"}
+
+    client.get("/api/v1/unlike-product", params={"product_id": "p1"})
+    assert _liked_ids(client) == table.liked("u1") == {"p3"}
+
+    # all of it from the one load
+    assert table.selects == 1
+
+
+def test_failed_like_leaves_liked_set(client, table):
+    table.rows = [{"user": "u1", "product": "p1"}]
+    assert _liked_ids(client) == {"p1"}
+
+    resp = client.get("/api/v1/like-product", params={"product_id": "p1"})
+    assert resp.status_code == 500
+    assert _liked_ids(client) == {"p1"}
+
+
+def test_liked_set_loads_every_page(client, table, monkeypatch):
+    monkeypatch.setattr(like, "LIKED_PAGE_SIZE", 3)
+    table.rows = [{"user": "u1", "product": f"p{i:02}"} for i in range(10)]
+
+    assert _liked_ids(client) == table.liked("u1")
+    assert table.selects == 4
+
+
+def test_mark_liked_products(client, table):
+    table.rows = [{"user": "u1", "product": "p2"}]
+    products = [{"id": "p1"}, {"id": "p2"}]
+
+    client.portal.call(like.mark_liked_products, products, "u1")
+
+    assert [p["liked"] for p in products] == [False, True]
+
+
+@pytest.fixture
+def liked_pages(client, monkeypatch):
+    # 25 likes, several sharing a created_at, newest first by (created_at, product)
+    rows = [
+        {"product": f"p{i:02}", "created_at": f"2026-01-{i // 3 + 1:02}T00:00:00"}
+        for i in range(25)
+    ]
+    ordered = sorted(rows, key=lambda r: (r["created_at"], r["product"]), reverse=True)
+
+    async def select(table, params):
+        result = ordered
+        if "or" in params:
+            # (created_at.lt."X",and(created_at.eq."X",product.lt."P"))
+            created_at, _, product = re.findall(r'"([^"]+)"', params["or"])
+            cursor = (created_at, product)
+            result = [r for r in ordered if (r["created_at"], r["product"]) < cursor]
+        offset = params.get("offset", 0)
+        return result[offset : offset + params["limit"]]
+
+    async def count(table, params):
+        return len(rows)
+
+    async def hydrate(ids, currency="DKK"):
+        return {pid: {"id": pid, "currency": currency} for pid in ids}
+
+    monkeypatch.setattr(like, "postgrest_select", select)
+    monkeypatch.setattr(like, "postgrest_count", count)
+    monkeypatch.setattr(like, "hydrate_products", hydrate)
+    return [r["product"] for r in ordered]
+
+
+def test_cursor_pages_cover_every_like_once(client, liked_pages):
+    seen = []
+    resp = client.get("/api/v1/get-liked-products", params={"limit": 10}).json()
+    assert resp["pagination"] == {
+        "total": 25,
+        "limit": 10,
+        "next_cursor": resp["pagination"]["next_cursor"],
+        "page": 1,
+        "total_pages": 3,
+    }
+    seen += [p["id"] for p in resp["products"]]
+
+    while resp["pagination"]["next_cursor"]:
+        resp = client.get(
+            "/api/v1/get-liked-products",
+            params={"limit": 10, "cursor": resp["pagination"]["next_cursor"]},
+        ).json()
+        # page numbers don't apply to cursor paging
+        assert set(resp["pagination"]) == {"total", "limit", "next_cursor"}
+        seen += [p["id"] for p in resp["products"]]
+
+    assert seen == liked_pages
+
+
+def test_offset_pages(client, liked_pages):
+    resp = client.get("/api/v1/get-liked-products", params={"page": 3, "limit": 10})
+    body = resp.json()
+
+    assert [p["id"] for p in body["products"]] == liked_pages[20:]
+    assert body["pagination"]["next_cursor"] is None
+    assert body["pagination"]["page"] == 3
+
+
+def test_invalid_cursor(client, liked_pages):
+    resp = client.get("/api/v1/get-liked-products", params={"cursor": "not-a-cursor"})
+    assert resp.status_code == 400
+
+
+def test_user_without_currency_gets_dkk(client, liked_pages):
+    main.app.dependency_overrides[get_current_user] = lambda: User(
+        id="u1", currency=None
+    )
+    resp = client.get("/api/v1/get-liked-products", params={"limit": 10})
+
+    assert resp.status_code == 200
+    assert {p["currency"] for p in resp.json()["products"]} == {"DKK"}
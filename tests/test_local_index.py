@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from services.local_index import LocalIndex, build_local_index
+from services.product_search import _gender_match
+from services.vector_store import VectorStore, build_vector_store
+
+DIM = 16
+LABELS = ["shirt", "shoes"]
+GENDERS = ["female", "male", "unisex"]
+
+
+@pytest.fixture(scope="module")
+def collection():
+    rng = np.random.default_rng(0)
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "vectors", vectors_config=VectorParams(size=DIM, distance=Distance.COSINE)
+    )
+    points = [
+        PointStruct(
+            id=i,
+            vector=rng.normal(size=DIM).tolist(),
+            payload={
+                "label": LABELS[i % 2],
+                "generalized_gender": GENDERS[i % 3],
+                "product_id": f"p{i // 2}",
+                "image_id": f"i{i}",
+            },
+        )
+        for i in range(300)
+    ]
+    client.upsert("vectors", points)
+    return client, {p.id: np.array(p.vector) for p in points}
+
+
+def test_local_index_matches_exact_search(collection, tmp_path):
+    client, vectors = collection
+    build_local_index(client, "vectors", str(tmp_path), batch=64)
+    index = LocalIndex(str(tmp_path))
+    assert index.vectors.shape == (300, DIM)
+
+    query = np.random.default_rng(1).normal(size=DIM)
+    hits = index.search(query, "shirt", _gender_match("female"), limit=10)
+
+    unit = query / np.linalg.norm(query)
+    expected = sorted(
+        (
+            i
+            for i in vectors
+            if i % 2 == 0 and GENDERS[i % 3] in _gender_match("female")
+        ),
+        key=lambda i: -(vectors[i] / np.linalg.norm(vectors[i])) @ unit,
+    )[:10]
+    assert [int(h.id) for h in hits] == expected
+    assert all(h.payload["product_id"] == f"p{int(h.id) // 2}" for h in hits)
+
+    # hits carry float32 rows, stacked as is for the rerank
+    assert isinstance(hits[0].vector, np.ndarray)
+    assert hits[0].vector.dtype == np.float32
+    assert np.array([h.vector for h in hits]).shape == (10, DIM)
+
+
+def test_vector_store_lookup(collection, tmp_path):
+    client, vectors = collection
+    build_vector_store(client, "vectors", str(tmp_path), batch=64)
+    store = VectorStore(str(tmp_path))
+
+    gallery, missing = store.lookup([5, 999, 42])
+
+    # cosine collections store unit vectors
+    assert missing == [1]
+    for row, point_id in ((0, 5), (2, 42)):
+        unit = vectors[point_id] / np.linalg.norm(vectors[point_id])
+        np.testing.assert_allclose(gallery[row], unit, atol=1e-3)
+    assert not gallery[1].any()
@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api.v1.manage as manage
+import dependencies
+import main
+from dependencies import User, get_current_user
+from services import product_hydration
+
+
+class FakeQuery:
+    """Records a fluent supabase-py query and returns `rows` on execute()."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args))
+            return self
+
+        return call
+
+    def execute(self):
+        return SimpleNamespace(data=self.rows)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(manage, "invalidate_user", invalidated.append)
+    main.app.dependency_overrides[get_current_user] = lambda: User(id="u1")
+    with TestClient(main.app) as c:
+        c.invalidated = invalidated
+        yield c
+    main.app.dependency_overrides.clear()
+
+
+def test_update_profile(client, monkeypatch):
+    query = FakeQuery([{"id": "u1", "country": "SE", "currency": "SEK"}])
+    monkeypatch.setattr(manage, "supabase", query)
+
+    resp = client.post(
+        "/api/v1/update-profile", json={"country": "se", "currency": "sek"}
+    )
+
+    assert resp.status_code == 200
+    assert resp.json() == {"success": True, "country": "SE", "currency": "SEK"}
+    assert query.calls == [
+        ("schema", ("tb2",)),
+        ("table", ("users",)),
+        ("update", ({"country": "SE", "currency": "SEK"},)),
+        ("eq", ("id", "u1")),
+    ]
+    assert client.invalidated == ["u1"]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [{}, {"country": "XX"}, {"currency": "ABC"}, {"country": "DK", "currency": "?"}],
+)
+def test_update_profile_rejects_invalid(client, monkeypatch, body):
+    query = FakeQuery([{"id": "u1"}])
+    monkeypatch.setattr(manage, "supabase", query)
+
+    assert client.post("/api/v1/update-profile", json=body).status_code == 400
+    assert query.calls == []
+    assert client.invalidated == []
+
+
+def test_update_profile_unknown_user(client, monkeypatch):
+    monkeypatch.setattr(manage, "supabase", FakeQuery([]))
+
+    resp = client.post("/api/v1/update-profile", json={"currency": "EUR"})
+
+    assert resp.status_code == 404
+    assert client.invalidated == []
+
+
+@pytest.fixture
+def refreshes(monkeypatch):
+    calls = []
+
+    def refresh(full=False):
+        calls.append(full)
+        return True
+
+    monkeypatch.setattr(manage.facet_catalogue, "refresh", refresh)
+    return calls
+
+
+def test_refresh_filters_requires_service_key(client, monkeypatch, refreshes):
+    monkeypatch.setattr(dependencies, "SERVICE_API_KEY", "secret")
+
+    assert client.post("/api/v1/refresh-filters").status_code == 403
+    resp = client.post("/api/v1/refresh-filters", headers={"X-Service-Key": "wrong"})
+    assert resp.status_code == 403
+    assert refreshes == []
+
+    resp = client.post("/api/v1/refresh-filters", headers={"X-Service-Key": "secret"})
+    assert resp.status_code == 200
+    assert resp.json()["changed"] is True
+    assert len(refreshes) == 1
+
+
+def test_refresh_filters_disabled_without_service_key(client, monkeypatch, refreshes):
+    monkeypatch.setattr(dependencies, "SERVICE_API_KEY", None)
+
+    resp = client.post("/api/v1/refresh-filters", headers={"X-Service-Key": ""})
+    assert resp.status_code == 403
+    assert refreshes == []
+
+
+def test_cache_stats_requires_service_key(client, monkeypatch):
+    monkeypatch.setattr(dependencies, "SERVICE_API_KEY", "secret")
+
+    assert client.get("/api/v1/cache-stats").status_code == 403
+    resp = client.get("/api/v1/cache-stats", headers={"X-Service-Key": "secret"})
+    assert resp.status_code == 200
+    assert "rerank" in resp.json()
+
+
+def test_products_updated_drops_cached_products(client, monkeypatch):
+    monkeypatch.setattr(dependencies, "SERVICE_API_KEY", "secret")
+    enriched = []
+    monkeypatch.setattr(
+        manage, "enrich_payload", lambda client, db, collection, ids: enriched.append(ids)
+    )
+    cache = product_hydration._product_cache
+    cache.clear()
+    for pid in ("p1", "p2", "p3"):
+        cache[pid] = {"DKK": {"id": pid}}
+
+    headers = {"X-Service-Key": "secret"}
+    assert client.post("/api/v1/products-updated", json={}).status_code == 403
+
+    resp = client.post(
+        "/api/v1/products-updated", json={"product_ids": ["p1", "p9"]}, headers=headers
+    )
+    assert resp.status_code == 200
+    assert set(cache) == {"p2", "p3"}
+    assert enriched == [["p1", "p9"]]
+
+    client.post("/api/v1/products-updated", json={}, headers=headers)
+    assert len(cache) == 0
+    assert len(enriched) == 1
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+from qdrant_client.models import ScoredPoint
+
+from services import product_search
+from services.product_search import (
+    RerankBusy,
+    SearchSettings,
+    _rerank_depth,
+    _rerank_hits,
+    _rerank_hits_async,
+    rerank_stats,
+)
+
+
+def _hits(scores, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        ScoredPoint(
+            id=i,
+            version=0,
+            score=score,
+            payload={"product_id": f"p{i}", "image_id": f"i{i}"},
+            vector=rng.random(dim, dtype=np.float32).tolist(),
+        )
+        for i, score in enumerate(scores)
+    ]
+
+
+def test_rerank_depth_skips_fewer_than_two_hits():
+    for adaptive in (False, True):
+        settings = SearchSettings(adaptive=adaptive)
+        assert _rerank_depth([], settings) == 0
+        assert _rerank_depth(_hits([0.9]), settings) == 0
+
+
+def test_rerank_depth_non_adaptive_reranks_everything():
+    hits = _hits([0.9, 0.8, 0.7])
+    assert _rerank_depth(hits, SearchSettings(adaptive=False)) == 3
+
+
+def test_single_hit_keeps_ann_order():
+    hits = _hits([0.9])
+    query = np.ones(8, dtype=np.float32)
+    results = _rerank_hits(query.tolist(), hits, SearchSettings(adaptive=False))
+    assert [r["product_id"] for r in results] == ["p0"]
+
+
+def test_two_hits_are_reranked():
+    hits = _hits([0.9, 0.85])
+    query = np.ones(8, dtype=np.float32)
+    results = _rerank_hits(query.tolist(), hits, SearchSettings(adaptive=False))
+    assert sorted(r["product_id"] for r in results) == ["p0", "p1"]
+    assert all(r["distance"] <= 1 for r in results)
+
+
+def test_full_rerank_queue_rejects_new_searches(monkeypatch):
+    monkeypatch.setattr(product_search, "RERANK_WORKERS", 0)
+    monkeypatch.setattr(product_search, "RERANK_MAX_WAITING", 2)
+    release = threading.Event()
+
+    def slow_rerank(vector, gallery, settings):
+        release.wait(5)
+        return np.zeros((1, len(gallery)), dtype=np.float32)
+
+    monkeypatch.setattr(product_search, "_rerank_matrix", slow_rerank)
+    hits = _hits([0.9, 0.8, 0.7])
+    settings = SearchSettings(adaptive=False)
+
+    async def run():
+        monkeypatch.setattr(product_search, "_rerank_slots", asyncio.Semaphore(1))
+        rerank = lambda: _rerank_hits_async([1.0] * 8, hits, settings)  # noqa: E731
+        running = [asyncio.create_task(rerank()) for _ in range(3)]  # 1 runs, 2 wait
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(RerankBusy):
+            await rerank()
+        stats = rerank_stats()
+
+        release.set()
+        results = await asyncio.gather(*running)
+        return stats, results
+
+    stats, results = asyncio.run(run())
+
+    assert stats["waiting"] == 2
+    assert stats["rejected"] == 1
+    assert all(len(r) == 3 for r in results)
+    assert rerank_stats()["waiting"] == 0
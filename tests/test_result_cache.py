@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sqlite3
+
+import pytest
+
+from services import result_cache
+from services.result_cache import LocalResultCache, SqliteResultCache
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir(mode=0o700)
+    return directory
+
+
+def test_local_cache():
+    cache = LocalResultCache("test", maxsize=10, ttl=60)
+    cache["a"] = [1, 2]
+
+    assert cache.get("a") == [1, 2]
+    assert cache.get("b") is None
+    assert "a" in cache
+    assert cache.pop("a") == [1, 2]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_sqlite_cache_is_shared(cache_dir):
+    path = str(cache_dir / "cache.sqlite")
+    writer = SqliteResultCache("test", path, max_bytes=1 << 20, ttl=60)
+    reader = SqliteResultCache("test", path, max_bytes=1 << 20, ttl=60)
+
+    writer["key"] = ({"p1": 0.9}, '"etag"')
+    assert reader.get("key") == ({"p1": 0.9}, '"etag"')
+    assert reader.get("other") is None
+
+
+def test_sqlite_cache_expiry_and_eviction(cache_dir):
+    path = str(cache_dir / "cache.sqlite")
+    expired = SqliteResultCache("expiry", path, max_bytes=1 << 20, ttl=-1)
+    expired["a"] = 1
+    assert expired.get("a") is None
+
+    small = SqliteResultCache("small", path, max_bytes=2500, ttl=60)
+    for i in range(5):
+        small[f"k{i}"] = b"x" * 1000
+    assert small.stats()["bytes"] <= 2500
+    assert small.get("k4") == b"x" * 1000
+    assert small.get("k0") is None
+
+
+def test_sqlite_cache_async(cache_dir):
+    cache = SqliteResultCache(
+        "async", str(cache_dir / "cache.sqlite"), max_bytes=1 << 20, ttl=60
+    )
+
+    async def run():
+        await cache.aset("a", {"x": 1})
+        return await cache.aget("a"), await cache.aget("b", "missing")
+
+    assert asyncio.run(run()) == ({"x": 1}, "missing")
+
+
+def test_sqlite_cache_locked_is_a_miss(cache_dir):
+    path = str(cache_dir / "cache.sqlite")
+    cache = SqliteResultCache("locked", path, max_bytes=1 << 20, ttl=60, timeout=0.01)
+    cache["a"] = 1
+
+    # another worker holding the write lock: the write is dropped, reads go on
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        cache["b"] = 2
+        assert cache.get("a") == 1
+    finally:
+        other.execute("ROLLBACK")
+    assert cache.get("b") is None
+
+
+def test_sqlite_cache_refuses_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+
+    with pytest.raises(PermissionError):
+        SqliteResultCache("test", str(shared / "cache.sqlite"), 1 << 20, 60)
+
+
+def test_default_path_is_per_user():
+    assert str(os.getuid()) in os.path.dirname(result_cache.RESULT_CACHE_PATH)
@@ -0,0 +1,168 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import api.v1.search as search
+import main
+from dependencies import User, get_current_user
+from services.product_search import RerankBusy
+
+
+def _product(pid: str, currency: str) -> dict:
+    n = int(pid[1:])
+    return {
+        "id": pid,
+        "brand": f"brand{n % 3}",
+        "from_price": float(n * 10),
+        "currency": currency,
+        "listings": [{"id": n % 2, "name": f"shop{n % 2}"}],
+    }
+
+
+@pytest.fixture
+def client(monkeypatch):
+    hydrated = []
+
+    async def select(table, params):
+        return [{"embedding": [0.1] * 4, "label": "shirt"}]
+
+    async def vector_search(**kwargs):
+        return [{"product_id": f"p{i}", "distance": i / 100} for i in range(30)]
+
+    async def hydrate(ids, currency="DKK"):
+        hydrated.append((list(ids), currency))
+        return {pid: _product(pid, currency) for pid in ids}
+
+    async def mark(products, user_id):
+        return products
+
+    monkeypatch.setattr(search, "postgrest_select", select)
+    monkeypatch.setattr(search, "vectorSearchAsync", vector_search)
+    monkeypatch.setattr(search, "hydrate_products", hydrate)
+    monkeypatch.setattr(search, "mark_liked_products", mark)
+    search.search_detection_cache.clear()
+    search.search_facets_cache.clear()
+
+    main.app.dependency_overrides[get_current_user] = lambda: User(
+        id="u1", currency="SEK"
+    )
+    with TestClient(main.app) as c:
+        c.hydrated = hydrated
+        yield c
+    main.app.dependency_overrides.clear()
+
+
+def _get(client, **params):
+    return client.get(
+        "/api/v1/search-detection",
+        params={"detection_id": "d1", "gender": "female", **params},
+    )
+
+
+def test_page_is_in_user_currency(client):
+    body = _get(client, page_size=5).json()
+
+    assert [p["id"] for p in body["products"]] == [f"p{i}" for i in range(5)]
+    assert {p["currency"] for p in body["products"]} == {"SEK"}
+    assert client.hydrated == [([f"p{i}" for i in range(5)], "SEK")]
+    assert body["next_cursor"] == "5"
+    assert body["total"] == 30
+
+
+def test_facets_hydrate_once(client):
+    body = _get(client, page_size=5, facets=True).json()
+
+    # one hydration of the whole ranking serves both the page and the facets
+    assert len(client.hydrated) == 1
+    assert client.hydrated[0][1] == "SEK"
+    assert {p["currency"] for p in body["products"]} == {"SEK"}
+    assert body["facets"]["price"]["currency"] == "SEK"
+    assert sum(b["count"] for b in body["facets"]["brand"]) == 30
+
+    # cached facets: only the next page is hydrated
+    body = _get(client, page_size=5, cursor="5", facets=True).json()
+    assert client.hydrated[1] == ([f"p{i}" for i in range(5, 10)], "SEK")
+    assert [p["index"] for p in body["products"]] == list(range(5, 10))
+
+
+def test_etag_round_trip(client):
+    etag = _get(client, page_size=5).headers["etag"]
+
+    cached = client.get(
+        "/api/v1/search-detection",
+        params={"detection_id": "d1", "gender": "female", "page_size": 5},
+        headers={"If-None-Match": etag},
+    )
+    assert cached.status_code == 304
+
+
+def test_etag_changes_with_products(client, monkeypatch):
+    etag = _get(client, page_size=5).headers["etag"]
+
+    # a product's price changed and the ranking was recomputed the same
+    async def hydrate(ids, currency="DKK"):
+        products = {pid: _product(pid, currency) for pid in ids}
+        products["p0"]["from_price"] = 1.0
+        return products
+
+    monkeypatch.setattr(search, "hydrate_products", hydrate)
+    search.search_detection_cache.clear()
+
+    resp = client.get(
+        "/api/v1/search-detection",
+        params={"detection_id": "d1", "gender": "female", "page_size": 5},
+        headers={"If-None-Match": etag},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert resp.json()["products"][0]["from_price"] == 1.0
+
+
+def test_concurrent_identical_searches_search_once(client, monkeypatch):
+    searches = 0
+
+    async def vector_search(**kwargs):
+        nonlocal searches
+        searches += 1
+        await asyncio.sleep(0.05)
+        return [{"product_id": f"p{i}", "distance": i / 100} for i in range(30)]
+
+    monkeypatch.setattr(search, "vectorSearchAsync", vector_search)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as ac:
+            return await asyncio.gather(
+                *(
+                    ac.get(
+                        "/api/v1/search-detection",
+                        params={"detection_id": "d2", "gender": "female"},
+                    )
+                    for _ in range(20)
+                )
+            )
+
+    responses = asyncio.run(burst())
+
+    assert searches == 1
+    assert {r.status_code for r in responses} == {200}
+    assert len({r.content for r in responses}) == 1
+
+
+def test_busy_rerank_queue_is_a_503(client, monkeypatch):
+    async def busy(**kwargs):
+        raise RerankBusy("queue full")
+
+    monkeypatch.setattr(search, "vectorSearchAsync", busy)
+
+    resp = _get(client, page_size=5)
+
+    assert resp.status_code == 503
+    assert resp.headers["retry-after"] == "1"
+    assert search.search_detection_cache.get(
+        search._cache_key("d1", "female")
+    ) is None
@@ -0,0 +1,43 @@
+import pytest
+
+from services.currency import currency_rates
+from services.search_payload import PAYLOAD_CURRENCIES, product_payload
+
+
+def _listing(feed_id, price, currency="DKK", in_stock=True):
+    return {
+        "price": price,
+        "currency": currency,
+        "in_stock": in_stock,
+        "feeds": {"id": feed_id},
+    }
+
+
+def test_payload_uses_in_stock_listings_only():
+    payload = product_payload(
+        {
+            "id": "p1",
+            "brand": "Acne",
+            "shop_listings": [
+                _listing(1, 500.0),
+                _listing(2, 400.0, "SEK"),
+                _listing(3, 100.0, in_stock=False),
+                _listing(4, None),
+            ],
+        }
+    )
+
+    assert payload["brand"] == "Acne"
+    assert payload["feed_ids"] == ["1", "2"]
+    assert set(payload["min_price"]) == set(PAYLOAD_CURRENCIES)
+    cheapest = min(
+        currency_rates.convert_rounded([500.0, 400.0], ["DKK", "SEK"], "DKK")
+    )
+    assert payload["min_price"]["DKK"] == pytest.approx(cheapest)
+
+
+def test_payload_without_stock():
+    payload = product_payload(
+        {"id": "p1", "brand": None, "shop_listings": [_listing(1, 10.0, in_stock=False)]}
+    )
+    assert payload == {"brand": None, "feed_ids": [], "min_price": {}}
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.single_flight import SingleFlight, ThreadSingleFlight
+
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def search(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return f"result {key}"
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(
+            *(flight.do("a", search, "a") for _ in range(50)),
+            flight.do("b", search, "b"),
+        )
+        return results, len(flight)
+
+    results, inflight = asyncio.run(run())
+
+    assert sorted(calls) == ["a", "b"]
+    assert results == ["result a"] * 50 + ["result b"]
+    assert inflight == 0
+
+
+def test_exception_reaches_every_caller():
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise ValueError("backend down")
+
+    async def run():
+        flight = SingleFlight()
+        return await asyncio.gather(
+            *(flight.do("k", fail) for _ in range(5)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+
+    assert calls == 1
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    async def slow():
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def run():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do("k", slow))
+        second = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == (42, True)
+
+
+def test_nothing_is_kept_after_completion():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    async def run():
+        flight = SingleFlight()
+        return await flight.do("k", compute), await flight.do("k", compute)
+
+    assert asyncio.run(run()) == (1, 2)
+
+
+def test_thread_single_flight():
+    calls = 0
+    started = threading.Event()
+
+    def load():
+        nonlocal calls
+        calls += 1
+        started.set()
+        time.sleep(0.05)
+        return "profile"
+
+    flight = ThreadSingleFlight()
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        first = pool.submit(flight.do, "u1", load)
+        started.wait()
+        rest = [pool.submit(flight.do, "u1", load) for _ in range(9)]
+        results = [first.result()] + [f.result() for f in rest]
+
+    assert calls == 1
+    assert results == ["profile"] * 10
+    assert len(flight) == 0
+
+
+def test_thread_single_flight_exception():
+    flight = ThreadSingleFlight()
+
+    def fail():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        flight.do("k", fail)
+    assert len(flight) == 0
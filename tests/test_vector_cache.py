@@ -0,0 +1,75 @@
+import numpy as np
+
+from services.vector_cache import SemanticVectorCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _perturbed(vec, scale, rng):
+    return vec + rng.normal(scale=scale, size=vec.shape).astype(np.float32)
+
+
+def test_perturbed_embedding_hits():
+    rng = np.random.default_rng(0)
+    cache = SemanticVectorCache(maxsize=100, threshold=0.99)
+    vec = rng.normal(size=512).astype(np.float32)
+    cache.put(vec, "shoes", "female", [{"product_id": "p1"}])
+
+    # a re-crop of the same item: cosine similarity ~0.9999
+    assert cache.get(_perturbed(vec, 0.01, rng), "shoes", "female") == [
+        {"product_id": "p1"}
+    ]
+    # a different item
+    assert cache.get(rng.normal(size=512), "shoes", "female") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_buckets_are_separate():
+    rng = np.random.default_rng(1)
+    cache = SemanticVectorCache()
+    vec = rng.normal(size=64).astype(np.float32)
+    cache.put(vec, "shoes", "female", [{"product_id": "p1"}], variant="a")
+
+    assert cache.get(vec, "shoes", "male", variant="a") is None
+    assert cache.get(vec, "bags", "female", variant="a") is None
+    assert cache.get(vec, "shoes", "female", variant="b") is None
+    assert cache.get(vec, "shoes", "female", variant="a") is not None
+
+
+def test_entries_expire():
+    rng = np.random.default_rng(2)
+    clock = Clock()
+    cache = SemanticVectorCache(ttl=300, timer=clock)
+    old = rng.normal(size=64).astype(np.float32)
+    cache.put(old, "shoes", None, [{"product_id": "old"}])
+
+    clock.now = 200
+    fresh = rng.normal(size=64).astype(np.float32)
+    cache.put(fresh, "shoes", None, [{"product_id": "fresh"}])
+    assert cache.get(old, "shoes", None) is not None
+
+    clock.now = 301
+    assert cache.get(old, "shoes", None) is None
+    assert cache.get(fresh, "shoes", None) == [{"product_id": "fresh"}]
+    assert cache.stats()["size"] == 1
+
+
+def test_lru_eviction():
+    rng = np.random.default_rng(3)
+    cache = SemanticVectorCache(maxsize=2)
+    a, b, c = (rng.normal(size=64).astype(np.float32) for _ in range(3))
+    cache.put(a, "shoes", None, ["a"])
+    cache.put(b, "shoes", None, ["b"])
+    cache.get(a, "shoes", None)
+    cache.put(c, "shoes", None, ["c"])
+
+    assert cache.get(b, "shoes", None) is None
+    assert cache.get(a, "shoes", None) == ["a"]
+    assert cache.get(c, "shoes", None) == ["c"]